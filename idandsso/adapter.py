@@ -28,12 +28,22 @@
 #     You should have received a copy of the GNU General Public License
 #     along with this program. If not, see <https://www.gnu.org/licenses/>.
 
+import base64
+import json
+import os
+import threading
+import time
+
 import requests
 from allauth.account.adapter import DefaultAccountAdapter
 from django.conf import settings
 from django.utils.http import urlencode
 from loguru import logger
 
+from .diagnostics import count_idp_call
+from .keycloak import token_refresh_margin
+from .metrics import timed
+
 
 class KeycloakOrcidAccountAdapter(DefaultAccountAdapter):
     def get_logout_redirect_url(self, request):
@@ -53,26 +63,83 @@ class KeycloakOrcidAccountAdapter(DefaultAccountAdapter):
             "post_logout_redirect_uri": post_logout_redirect_uri,
         }
 
-        token_endpoint = f"{oidc_endpoint}token"
-        logger.debug(f"Requesting id token from '{token_endpoint}'")
-        res = requests.post(
-            token_endpoint,
-            data={
-                "grant_type": "client_credentials",
-                "client_id": client_id,
-                "client_secret": client_secret,
-                "scope": "openid",
-            },
-            timeout=5,
-        )
-        if res.status_code != 200:
-            logger.error(
-                f"Could not retrieve id_token for user '{request.user.username}'. Code: '{res.status_code}'. Content: '{str(res.content)}'"
-            )
-        else:
-            res_json = res.json()
-            params["id_token_hint"] = res_json["id_token"]
+        with timed("logout_token") as observation:
+            id_token = _cached_id_token(oidc_endpoint)
+            if id_token:
+                observation.outcome = "cache_hit"
+            else:
+                token_endpoint = f"{oidc_endpoint}token"
+                logger.debug(f"Requesting id token from '{token_endpoint}'")
+                res = _http_session().post(
+                    token_endpoint,
+                    data={
+                        "grant_type": "client_credentials",
+                        "client_id": client_id,
+                        "client_secret": client_secret,
+                        "scope": "openid",
+                    },
+                    timeout=5,
+                )
+                if res.status_code != 200:
+                    observation.outcome = "error"
+                    logger.error(
+                        f"Could not retrieve id_token for user '{request.user.username}'. Code: '{res.status_code}'. Content: '{str(res.content)}'"
+                    )
+                else:
+                    res_json = res.json()
+                    id_token = res_json["id_token"]
+                    _cache_id_token(oidc_endpoint, id_token, res_json)
+        if id_token:
+            params["id_token_hint"] = id_token
 
         logout_url = f"{oidc_endpoint}logout?{urlencode(params)}"
         logger.debug(f"Logout URL generated '{logout_url}'")
         return logout_url
+
+
+#
+#   The client-credentials id_token is the same for all users, hence it is cached until shortly
+#   before it expires. The session pools the connections to the token endpoint.
+#
+_lock = threading.Lock()
+_session = None
+_id_tokens = {}
+
+
+def _http_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = requests.Session()
+                _session.hooks["response"].append(count_idp_call)
+    return _session
+
+
+def _reset() -> None:
+    global _lock, _session
+    _lock = threading.Lock()
+    _session = None
+    _id_tokens.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset)
+
+
+def _cached_id_token(oidc_endpoint: str) -> str | None:
+    id_token, expires_at, lifetime = _id_tokens.get(oidc_endpoint, (None, 0, 0))
+    if time.time() < expires_at - token_refresh_margin(lifetime):
+        return id_token
+    return None
+
+
+def _cache_id_token(oidc_endpoint: str, id_token: str, token_response: dict) -> None:
+    now = time.time()
+    try:
+        payload = id_token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        expires_at = claims["exp"]
+    except (IndexError, KeyError, TypeError, ValueError):
+        expires_at = now + token_response.get("expires_in", 0)
+    _id_tokens[oidc_endpoint] = (id_token, expires_at, expires_at - now)
@@ -28,12 +28,15 @@
 #     You should have received a copy of the GNU General Public License
 #     along with this program. If not, see <https://www.gnu.org/licenses/>.
 
+import threading
+
 from django.apps import AppConfig
 from django.conf import settings
 from loguru import logger
 
 
 class IdAndSsoConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
     name = "idandsso"
     verbose_name = "ID & SSO"
 
@@ -43,6 +46,7 @@ class IdAndSsoConfig(AppConfig):
         self._check_required_settings()
         self._check_middleware()
         self._check_idp_availability()
+        self._warm_group_id_cache()
 
         import idandsso.signals  # noqa F401
 
@@ -112,18 +116,20 @@ class IdAndSsoConfig(AppConfig):
             logger.error("idandsso middleware MUST be configured BEFORE allauth account middleware")
 
     def _check_idp_availability(self):
-        try:
-            import requests
+        from idandsso.health import schedule_idp_probe
 
-            response = requests.get(
-                settings.IDANDSSO_PROVIDER_HOST, timeout=settings.GEONODE_API_TIMEOUT
-            )
-            if response.status_code != 200:
-                raise Exception(
-                    f"IDP instance not reachable at '{settings.IDANDSSO_PROVIDER_HOST}'"
-                )
-        except Exception as e:
-            logger.warning(
-                f"Error connecting to IDP instance at '{settings.IDANDSSO_PROVIDER_HOST}', configured IDANDSSO_PROVIDER_HOST may be incorrect or IDP not available ..."
-            )
-            logger.warning(e)
+        schedule_idp_probe()
+
+    def _warm_group_id_cache(self):
+        if not getattr(settings, "IDANDSSO_GROUP_ID_CACHE_WARM_ON_STARTUP", False):
+            return
+
+        def warm():
+            from idandsso.keycloak import warm_keycloak_group_id_cache
+
+            try:
+                warm_keycloak_group_id_cache()
+            except Exception as e:
+                logger.warning(f"Could not warm keycloak group id cache: {e}")
+
+        threading.Thread(target=warm, name="idandsso-warm-group-id-cache", daemon=True).start()
@@ -0,0 +1,165 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+#
+#   declarative projection of the social account claims onto user fields compiled
+#   from IDANDSSO_CLAIMS_MAP
+#
+#   Each user field maps to a claim path into `extra_data` and an optional transform,
+#   i.e. a callable or its dotted path, e.g.
+#
+#       {
+#           "first_name": "userinfo.given_name",
+#           "rorlink": ("userinfo.affiliation.organization", "idandsso.claims.ror_link"),
+#       }
+#
+#   A transform returning KEEP, or a missing claim without transform, leaves the field untouched.
+#
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from loguru import logger
+
+KEEP = object()
+
+
+def is_staff(groups) -> bool:
+    return settings.IDANDSSO_GROUP_NAME_DJANGO_STAFF in (groups or ())
+
+
+def is_superuser(groups) -> bool:
+    return settings.IDANDSSO_GROUP_NAME_DJANGO_SUPERUSER in (groups or ())
+
+
+def organization_name(organization):
+    """
+    Using ORCID API affiliation
+
+    See https://github.com/ORCID/orcid-model
+    """
+    return (organization or {}).get("name") or KEEP
+
+
+def ror_link(organization):
+    """
+    The ROR identifier of an ORCID affiliation, kept along with the organization name only.
+    """
+    if not (organization or {}).get("name"):
+        return KEEP
+    disambiguated = organization.get("disambiguated-organization") or {}
+    if disambiguated.get("disambiguation-source") != "ROR":
+        return None
+    return disambiguated.get("disambiguated-organization-identifier")
+
+
+DEFAULT_CLAIMS_MAP = {
+    "is_staff": ("id_token.groups", is_staff),
+    "is_superuser": ("id_token.groups", is_superuser),
+    "organization": ("userinfo.affiliation.organization", organization_name),
+    "rorlink": ("userinfo.affiliation.organization", ror_link),
+}
+
+
+class ClaimsProjection:
+    def __init__(self, claims_map: dict):
+        self.rules = []
+        for field, rule in claims_map.items():
+            path, transform = (rule, None) if isinstance(rule, str) else rule
+            if isinstance(transform, str):
+                transform = import_string(transform)
+            self.rules.append((field, tuple(path.split(".")), transform))
+
+    def project(self, user, extra_data: dict) -> [str]:
+        """
+        Sets the fields differing from the claims on `user` and returns their names.
+        The user is not saved.
+        """
+        resolved = {}
+        changed_fields = []
+        for field, path, transform in self.rules:
+            if path not in resolved:
+                resolved[path] = _resolve(extra_data, path)
+            value = resolved[path]
+            if transform:
+                value = transform(value)
+            elif value is None:
+                value = KEEP
+            if value is KEEP:
+                continue
+            if getattr(user, field) != value:
+                setattr(user, field, value)
+                changed_fields.append(field)
+        logger.debug(f"Claims changed fields {changed_fields} of user '{user.username}'")
+        return changed_fields
+
+    def fingerprint(self, extra_data: dict) -> str:
+        """
+        Hash of the claims relevant for a login, i.e. the projected ones and the groups,
+        along with the settings interpreting them.
+        """
+        paths = sorted({path for _, path, _ in self.rules} | {("id_token", "groups")})
+        relevant = {
+            "claims": [[".".join(path), _resolve(extra_data, path)] for path in paths],
+            "rules": [
+                [field, ".".join(path), getattr(transform, "__qualname__", None)]
+                for field, path, transform in self.rules
+            ],
+            "group_map": settings.IDANDSSO_GROUP_MAP,
+            "staff": settings.IDANDSSO_GROUP_NAME_DJANGO_STAFF,
+            "superuser": settings.IDANDSSO_GROUP_NAME_DJANGO_SUPERUSER,
+        }
+        encoded = json.dumps(relevant, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+
+def _resolve(data: dict, path: (str)):
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+_projection = None
+
+
+def claims_projection() -> ClaimsProjection:
+    global _projection
+    if _projection is None:
+        _projection = ClaimsProjection(getattr(settings, "IDANDSSO_CLAIMS_MAP", DEFAULT_CLAIMS_MAP))
+    return _projection
+
+
+def reset_claims_projection() -> None:
+    global _projection
+    _projection = None
@@ -0,0 +1,218 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+#
+#   opt-in per request diagnostics, enabled by IDANDSSO_DIAGNOSTICS
+#
+#   KeycloakSilentSSOMiddleware collects the SQL queries issued from idandsso code, the HTTP
+#   calls to the IDP and the durations of the operations observed by `metrics.timed`, e.g.
+#   `login` and `sync`. They are added as Server-Timing header, logged and compared with the
+#   IDANDSSO_DIAGNOSTICS_BUDGETS, e.g.
+#
+#       {"queries": 5, "idp_calls": 2, "ms": 100}
+#
+
+import functools
+import sys
+import threading
+import time
+from contextlib import (
+    ExitStack,
+    contextmanager,
+)
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import connections
+from loguru import logger
+
+_current = Local()
+
+# modules, whose frames do not attribute a query to idandsso, as they wrap the whole request
+_WRAPPING_MODULES = ("idandsso.middleware", "idandsso.diagnostics")
+
+
+class RequestDiagnostics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.idp_calls = 0
+        self.operations = {}
+
+    def record_operation(self, operation: str, seconds: float) -> None:
+        with self._lock:
+            count, total = self.operations.get(operation, (0, 0.0))
+            self.operations[operation] = (count + 1, total + seconds)
+
+    def record_query(self, seconds: float) -> None:
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += seconds
+
+    def record_idp_call(self) -> None:
+        with self._lock:
+            self.idp_calls += 1
+
+    def server_timing(self) -> str:
+        entries = [
+            f'idandsso-db;desc="{self.queries} queries";dur={self.query_seconds * 1000:.1f}',
+            f'idandsso-idp;desc="{self.idp_calls} calls"',
+        ]
+        for operation, (count, seconds) in sorted(self.operations.items()):
+            entries.append(f'idandsso-{operation};desc="{count}x";dur={seconds * 1000:.1f}')
+        return ", ".join(entries)
+
+    def as_dict(self) -> dict:
+        return {
+            "ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "queries": self.queries,
+            "query_ms": round(self.query_seconds * 1000, 1),
+            "idp_calls": self.idp_calls,
+            "operations": {
+                operation: {"count": count, "ms": round(seconds * 1000, 1)}
+                for operation, (count, seconds) in self.operations.items()
+            },
+        }
+
+
+def is_diagnostics_enabled() -> bool:
+    return getattr(settings, "IDANDSSO_DIAGNOSTICS", False)
+
+
+def current_diagnostics() -> RequestDiagnostics | None:
+    return getattr(_current, "diagnostics", None)
+
+
+@contextmanager
+def request_diagnostics(count_queries: bool = True):
+    """
+    Collects the diagnostics of the block. Queries are counted on the database connections
+    of the current thread only, hence `count_queries` is disabled for async requests.
+    """
+    diagnostics = RequestDiagnostics()
+    previous = current_diagnostics()
+    _current.diagnostics = diagnostics
+    try:
+        with ExitStack() as stack:
+            if count_queries:
+                wrapper = _query_counter(diagnostics)
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(wrapper))
+            yield diagnostics
+    finally:
+        _current.diagnostics = previous
+
+
+def report(request, response, diagnostics: RequestDiagnostics) -> None:
+    """
+    Adds the Server-Timing header, logs the diagnostics and warns about exceeded budgets.
+    """
+    server_timing = diagnostics.server_timing()
+    if response.has_header("Server-Timing"):
+        server_timing = f"{response['Server-Timing']}, {server_timing}"
+    response["Server-Timing"] = server_timing
+    data = diagnostics.as_dict()
+    logger.bind(idandsso_diagnostics=data).debug(
+        f"idandsso diagnostics of {request.method} '{request.path}': {data}"
+    )
+    budgets = getattr(settings, "IDANDSSO_DIAGNOSTICS_BUDGETS", {})
+    for key, budget in budgets.items():
+        if key in data and data[key] > budget:
+            logger.warning(
+                f"idandsso exceeded the '{key}' budget of {budget} with {data[key]} "
+                f"in {request.method} '{request.path}'"
+            )
+
+
+def record_operation(operation: str, seconds: float) -> None:
+    diagnostics = current_diagnostics()
+    if diagnostics is not None:
+        diagnostics.record_operation(operation, seconds)
+
+
+def instrument_connection(connection) -> None:
+    """
+    Counts the HTTP calls of a python-keycloak ConnectionManager, sync and async, by wrapping
+    its public `raw_*` methods, like `connection.execute_wrapper` wraps the database queries.
+    """
+    for method in _RAW_METHODS:
+        setattr(connection, method, _call_counter(getattr(connection, method)))
+        async_method = f"a_{method}"
+        setattr(connection, async_method, _acall_counter(getattr(connection, async_method)))
+
+
+def count_idp_call(response, *args, **kwargs):
+    diagnostics = current_diagnostics()
+    if diagnostics is not None:
+        diagnostics.record_idp_call()
+    return response
+
+
+_RAW_METHODS = ("raw_get", "raw_post", "raw_put", "raw_delete")
+
+
+def _call_counter(call):
+    @functools.wraps(call)
+    def count_call(*args, **kwargs):
+        return count_idp_call(call(*args, **kwargs))
+
+    return count_call
+
+
+def _acall_counter(call):
+    @functools.wraps(call)
+    async def count_call(*args, **kwargs):
+        return count_idp_call(await call(*args, **kwargs))
+
+    return count_call
+
+
+def _query_counter(diagnostics: RequestDiagnostics):
+    def count_query(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if _is_called_from_idandsso():
+                diagnostics.record_query(time.perf_counter() - started)
+
+    return count_query
+
+
+def _is_called_from_idandsso() -> bool:
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("idandsso.") and not module.startswith(_WRAPPING_MODULES):
+            return True
+        frame = frame.f_back
+    return False
@@ -0,0 +1,183 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+#
+#   incremental sync of keycloak admin events, e.g. posted by a keycloak event listener
+#   to the webhook view
+#
+#   Only group membership events are applied, see
+#
+#       https://www.keycloak.org/docs-api/latest/rest-api/index.html#AdminEventRepresentation
+#
+
+import json
+from datetime import timedelta
+
+from allauth.socialaccount.models import SocialAccount
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.utils import timezone
+from loguru import logger
+
+from .groupmap import group_mapping
+from .models import KeycloakEventReceipt
+from .sync import changes_from_keycloak
+
+GROUP_MEMBERSHIP = "GROUP_MEMBERSHIP"
+
+
+def apply_admin_events(events: [dict]) -> dict:
+    """
+    Applies the group membership events not received before in bulk, the latest event
+    of a user and group wins. Returns counts of the events by outcome.
+    """
+    counts = {"received": len(events), "duplicates": 0, "applied": 0, "ignored": 0}
+    events_by_id = {}
+    for event in events:
+        if not event.get("id"):
+            counts["ignored"] += 1
+        elif event["id"] in events_by_id:
+            counts["duplicates"] += 1
+        else:
+            events_by_id[event["id"]] = event
+
+    with transaction.atomic(), changes_from_keycloak():
+        received_ids = set(
+            KeycloakEventReceipt.objects.filter(pk__in=events_by_id).values_list("pk", flat=True)
+        )
+        counts["duplicates"] += len(received_ids)
+        new_events = [
+            event for event_id, event in events_by_id.items() if event_id not in received_ids
+        ]
+        KeycloakEventReceipt.objects.bulk_create(
+            [KeycloakEventReceipt(event_id=event["id"]) for event in new_events],
+            ignore_conflicts=True,
+        )
+        # latest membership per (keycloak user id, keycloak group name)
+        memberships = {}
+        for event in sorted(new_events, key=lambda event: event.get("time", 0)):
+            membership = _parse_membership(event)
+            if membership is None:
+                counts["ignored"] += 1
+                continue
+            kc_user_id, kc_group_name, is_add = membership
+            memberships[(kc_user_id, kc_group_name)] = is_add
+            counts["applied"] += 1
+        if memberships:
+            _apply_memberships(memberships)
+    _prune_receipts()
+    logger.debug(f"Applied keycloak admin events: {counts}")
+    return counts
+
+
+def _parse_membership(event: dict) -> (str, str, bool):
+    if event.get("resourceType") != GROUP_MEMBERSHIP:
+        return None
+    if event.get("operationType") not in ["CREATE", "DELETE"]:
+        return None
+    # resourcePath: users/{user id}/groups/{group id}
+    parts = (event.get("resourcePath") or "").split("/")
+    if len(parts) != 4 or parts[0] != "users" or parts[2] != "groups":
+        return None
+    try:
+        group = json.loads(event.get("representation") or "{}")
+    except (TypeError, ValueError):
+        group = {}
+    group_name = group.get("name") or (group.get("path") or "").rsplit("/", 1)[-1]
+    if not group_name:
+        logger.warning(f"Ignoring keycloak admin event '{event['id']}' without group name")
+        return None
+    return parts[1], group_name, event["operationType"] == "CREATE"
+
+
+def _apply_memberships(memberships: {(str, str): bool}) -> None:
+    """
+    Writes the memberships using bulk changes of the through table, which do not send
+    m2m_changed, and queryset updates of the staff and superuser flags.
+    """
+    user_ids = dict(
+        SocialAccount.objects.filter(
+            provider=settings.IDANDSSO_PROVIDER_ID,
+            uid__in={kc_user_id for kc_user_id, _ in memberships},
+        ).values_list("uid", "user_id")
+    )
+    flags = {
+        settings.IDANDSSO_GROUP_NAME_DJANGO_STAFF: "is_staff",
+        settings.IDANDSSO_GROUP_NAME_DJANGO_SUPERUSER: "is_superuser",
+    }
+    mapping = group_mapping()
+    django_group_names = {
+        kc_group_name: mapping.django_group_name(kc_group_name)
+        for _, kc_group_name in memberships
+        if kc_group_name not in flags
+    }
+    # resolved by name, as the group index of this process may be stale
+    group_ids = dict(
+        Group.objects.filter(name__in=set(django_group_names.values()) - {None}).values_list(
+            "name", "pk"
+        )
+    )
+    additions, removals, flag_changes = [], {}, {}
+    for (kc_user_id, kc_group_name), is_add in memberships.items():
+        user_id = user_ids.get(kc_user_id)
+        if user_id is None:
+            # not logged in yet, the memberships are set on the first login
+            continue
+        if kc_group_name in flags:
+            flag_changes.setdefault((flags[kc_group_name], is_add), []).append(user_id)
+            continue
+        group_id = group_ids.get(django_group_names[kc_group_name])
+        if group_id is None:
+            continue
+        if is_add:
+            additions.append((user_id, group_id))
+        else:
+            removals.setdefault(group_id, []).append(user_id)
+
+    user_model = get_user_model()
+    membership = user_model.groups.through
+    if additions:
+        membership.objects.bulk_create(
+            [membership(user_id=user_id, group_id=group_id) for user_id, group_id in additions],
+            ignore_conflicts=True,
+        )
+    for group_id, group_user_ids in removals.items():
+        membership.objects.filter(group_id=group_id, user_id__in=group_user_ids).delete()
+    for (field, value), flag_user_ids in flag_changes.items():
+        user_model.objects.filter(pk__in=flag_user_ids).update(**{field: value})
+
+
+def _prune_receipts() -> None:
+    retention = getattr(settings, "IDANDSSO_WEBHOOK_EVENT_RETENTION", 7 * 24 * 3600)
+    KeycloakEventReceipt.objects.filter(
+        received_at__lt=timezone.now() - timedelta(seconds=retention)
+    ).delete()
@@ -0,0 +1,108 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+#
+#   index of the django group names by primary key
+#
+#   It names the groups of membership changes synced to keycloak, e.g. by m2m_changed, which
+#   only passes primary keys. Memberships are written with groups read from the database, as a
+#   group may be deleted, re-created or renamed by another process meanwhile.
+#
+#   Groups change rarely, hence the index is loaded with one query and kept in the django cache
+#   configured by IDANDSSO_GROUP_INDEX_CACHE_ALIAS, shared between processes, or in this process
+#   if it is None. It is invalidated by the post_save and post_delete signals of Group and expires
+#   after IDANDSSO_GROUP_INDEX_TIMEOUT seconds, as bulk changes do not send signals.
+#
+
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import caches
+from loguru import logger
+
+_CACHE_KEY = "idandsso:group_names"
+
+_lock = threading.Lock()
+_index = None
+_loaded_at = 0
+
+
+def group_names(pks: (int)) -> {int: str}:
+    """
+    The names of the existing groups by primary key.
+    """
+    pks = set(pks)
+    by_pk = _by_pk()
+    if not pks <= by_pk.keys():
+        # created since the index was loaded, or not existing at all
+        by_pk = _by_pk(reload=True)
+    return {pk: by_pk[pk] for pk in pks if pk in by_pk}
+
+
+def invalidate_group_index() -> None:
+    global _index
+    with _lock:
+        _index = None
+    alias = _cache_alias()
+    if alias:
+        caches[alias].delete(_CACHE_KEY)
+
+
+def _by_pk(reload: bool = False) -> {int: str}:
+    global _index, _loaded_at
+    alias = _cache_alias()
+    if alias:
+        by_pk = None if reload else caches[alias].get(_CACHE_KEY)
+        if by_pk is None:
+            by_pk = _query()
+            caches[alias].set(_CACHE_KEY, by_pk, timeout=_timeout())
+        return by_pk
+    index = _index
+    if reload or index is None or time.monotonic() - _loaded_at > _timeout():
+        index = _query()
+        with _lock:
+            _index, _loaded_at = index, time.monotonic()
+    return index
+
+
+def _query() -> {int: str}:
+    by_pk = dict(Group.objects.values_list("pk", "name"))
+    logger.debug(f"Loaded index of {len(by_pk)} django groups")
+    return by_pk
+
+
+def _cache_alias() -> str | None:
+    return getattr(settings, "IDANDSSO_GROUP_INDEX_CACHE_ALIAS", "default")
+
+
+def _timeout() -> int:
+    return getattr(settings, "IDANDSSO_GROUP_INDEX_TIMEOUT", 300)
@@ -0,0 +1,150 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+#
+#   bidirectional mapping between keycloak and django group names compiled from
+#   IDANDSSO_GROUP_MAP
+#
+#   Keys and values are either exact group names or patterns with one `*`, e.g.
+#
+#       {"ut_users": "users", "ut_project_*": "project_*", "ut_team_*_members": "team_*"}
+#
+#   Patterns with a `*` on one side only are used in that direction only.
+#
+#   An empty map keeps the keycloak group names at login, but no django group is synced to
+#   keycloak, as before the mapping was compiled.
+#
+
+import re
+
+from django.conf import settings
+from loguru import logger
+
+_UNMAPPED = object()
+
+
+class GroupMapping:
+    def __init__(self, group_map: dict, ignored_keycloak_groups: (str)):
+        self.identity = not group_map
+        self.ignored_keycloak_groups = set(ignored_keycloak_groups)
+        self.to_django_exact = {}
+        self.patterns = []
+        for kc_name, django_name in (group_map or {}).items():
+            if "*" not in kc_name and "*" not in django_name:
+                self.to_django_exact[kc_name] = django_name
+            elif kc_name.count("*") > 1 or django_name.count("*") > 1:
+                logger.error(f"Ignoring group mapping '{kc_name}': '{django_name}', use one '*'")
+            else:
+                self.patterns.append(
+                    (_compile(kc_name), django_name, _compile(django_name), kc_name)
+                )
+        # memoised lookups incl. the ones resolved by patterns
+        self.to_django = dict(self.to_django_exact)
+        self.to_keycloak = {}
+        for kc_name, django_name in self.to_django_exact.items():
+            self.to_keycloak.setdefault(django_name, kc_name)
+
+    def django_group_name(self, kc_name: str) -> str | None:
+        if kc_name in self.ignored_keycloak_groups:
+            return None
+        if self.identity:
+            return kc_name
+        django_name = self.to_django.get(kc_name, _UNMAPPED)
+        if django_name is _UNMAPPED:
+            django_name = self._match(kc_name, to_django=True)
+            if not django_name:
+                logger.error(f"No mapping found for social group '{kc_name}'")
+            self.to_django[kc_name] = django_name
+        return django_name
+
+    def keycloak_group_name(self, django_name: str) -> str | None:
+        if self.identity:
+            return None
+        kc_name = self.to_keycloak.get(django_name, _UNMAPPED)
+        if kc_name is _UNMAPPED:
+            kc_name = self._match(django_name, to_django=False)
+            self.to_keycloak[django_name] = kc_name
+        return kc_name
+
+    def django_group_names(self, kc_names: (str)) -> {str}:
+        return {
+            django_name
+            for django_name in map(self.django_group_name, kc_names)
+            if django_name is not None
+        }
+
+    def keycloak_group_names(self, django_names: (str)) -> {str}:
+        return {
+            kc_name
+            for kc_name in map(self.keycloak_group_name, django_names)
+            if kc_name is not None
+        }
+
+    def has_patterns(self) -> bool:
+        return len(self.patterns) > 0
+
+    def _match(self, name: str, to_django: bool) -> str | None:
+        for kc_pattern, django_name, django_pattern, kc_name in self.patterns:
+            pattern, target = (kc_pattern, django_name) if to_django else (django_pattern, kc_name)
+            match = pattern.fullmatch(name)
+            if match:
+                if "*" in target and not match.groups():
+                    # a constant cannot be mapped back to a pattern
+                    continue
+                return target.replace("*", match.group(1)) if "*" in target else target
+        return None
+
+
+def _compile(name: str) -> re.Pattern:
+    if "*" not in name:
+        return re.compile(re.escape(name))
+    prefix, suffix = name.split("*")
+    return re.compile(f"{re.escape(prefix)}(.+){re.escape(suffix)}")
+
+
+_mapping = None
+
+
+def group_mapping() -> GroupMapping:
+    global _mapping
+    if _mapping is None:
+        _mapping = GroupMapping(
+            settings.IDANDSSO_GROUP_MAP,
+            [
+                settings.IDANDSSO_GROUP_NAME_DJANGO_STAFF,
+                settings.IDANDSSO_GROUP_NAME_DJANGO_SUPERUSER,
+            ],
+        )
+    return _mapping
+
+
+def reset_group_mapping() -> None:
+    global _mapping
+    _mapping = None
@@ -0,0 +1,133 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+#
+#   cached availability of the IDP, probed in the background instead of blocking startup
+#
+
+import sys
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from loguru import logger
+
+_lock = threading.Lock()
+_status = {
+    "available": None,
+    "latency": None,
+    "checked_at": None,
+    "error": None,
+}
+_probing = threading.Event()
+
+
+def probe_idp() -> dict:
+    """
+    Requests IDANDSSO_PROVIDER_HOST and caches the result.
+    """
+    started = time.monotonic()
+    error = None
+    try:
+        response = requests.get(
+            settings.IDANDSSO_PROVIDER_HOST, timeout=settings.GEONODE_API_TIMEOUT
+        )
+        if response.status_code != 200:
+            error = f"IDP instance not reachable at '{settings.IDANDSSO_PROVIDER_HOST}'"
+    except Exception as e:
+        error = str(e)
+    latency = time.monotonic() - started
+    if error:
+        logger.warning(
+            f"Error connecting to IDP instance at '{settings.IDANDSSO_PROVIDER_HOST}', configured IDANDSSO_PROVIDER_HOST may be incorrect or IDP not available ..."
+        )
+        logger.warning(error)
+    with _lock:
+        _status.update(
+            available=error is None,
+            latency=latency,
+            checked_at=timezone.now(),
+            error=error,
+        )
+        return dict(_status)
+
+
+def probe_idp_in_background() -> None:
+    with _lock:
+        if _probing.is_set():
+            return
+        _probing.set()
+
+    def probe():
+        try:
+            probe_idp()
+        finally:
+            _probing.clear()
+
+    threading.Thread(target=probe, name="idandsso-idp-probe", daemon=True).start()
+
+
+def schedule_idp_probe() -> None:
+    """
+    Called on startup, see IDANDSSO_IDP_PROBE.
+    """
+    mode = getattr(settings, "IDANDSSO_IDP_PROBE", "background")
+    if mode in ["off", "lazy"] or (mode == "background" and _is_management_command()):
+        return
+    if mode == "sync":
+        probe_idp()
+    else:
+        probe_idp_in_background()
+
+
+def idp_status() -> dict:
+    """
+    Returns the cached IDP status. It is probed on first use, if not available yet, and
+    refreshed in the background, if older than IDANDSSO_IDP_PROBE_INTERVAL seconds.
+    """
+    with _lock:
+        status = dict(_status)
+    if status["checked_at"] is None:
+        return probe_idp()
+    max_age = getattr(settings, "IDANDSSO_IDP_PROBE_INTERVAL", 60)
+    if (timezone.now() - status["checked_at"]).total_seconds() > max_age:
+        probe_idp_in_background()
+    return status
+
+
+def _is_management_command() -> bool:
+    program = sys.argv[0] if sys.argv else ""
+    return (
+        program.endswith(("manage.py", "django-admin"))
+        and len(sys.argv) > 1
+        and sys.argv[1] != "runserver"
+    )
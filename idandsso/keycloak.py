@@ -28,69 +28,574 @@
 #     You should have received a copy of the GNU General Public License
 #     along with this program. If not, see <https://www.gnu.org/licenses/>.
 
+import asyncio
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
 from allauth.socialaccount.models import SocialAccount
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.cache import caches
 from keycloak import KeycloakAdmin
-from keycloak.exceptions import KeycloakError
+from keycloak.exceptions import (
+    KeycloakConnectionError,
+    KeycloakError,
+)
 from loguru import logger
 
+from .diagnostics import instrument_connection
+from .groupmap import group_mapping
+from .metrics import timed
+from .utils import LoopLocal
+
 
-def add_user_to_keycloak_group(user: settings.AUTH_USER_MODEL, group_name: str) -> bool:
+def add_user_to_keycloak_group(
+    user: settings.AUTH_USER_MODEL, group_name: str, kc_user_id: str | None = None
+) -> bool:
     logger.debug(f"Add User '{user.username}' to group '{group_name}'.")
-    kc_user_id = _get_keycloak_user_id_from(user)
-    kc_admin = _keycloak_admin()
-    kc_group_id = _get_keycloak_group_id_by_name(kc_admin, group_name)
+    kc_user_id = kc_user_id or _get_keycloak_user_id_from(user)
 
-    #
-    # https://python-keycloak.readthedocs.io/en/v5.8.1/reference/keycloak/keycloak_admin/index.html#keycloak.keycloak_admin.KeycloakAdmin.group_user_add
-    #
-    kc_admin.group_user_add(user_id=kc_user_id, group_id=kc_group_id)
+    def add():
+        kc_admin = _keycloak_admin()
+
+        #
+        # https://python-keycloak.readthedocs.io/en/v5.8.1/reference/keycloak/keycloak_admin/index.html#keycloak.keycloak_admin.KeycloakAdmin.group_user_add
+        #
+        _call_with_group_id(
+            kc_admin,
+            group_name,
+            lambda kc_group_id: kc_admin.group_user_add(user_id=kc_user_id, group_id=kc_group_id),
+        )
+
+    _resilient_call(add)
     logger.debug(f"Done adding User '{user.username}' to group '{group_name}'.")
 
 
-def remove_user_from_keycloak_group(user: settings.AUTH_USER_MODEL, group_name: str) -> bool:
+def remove_user_from_keycloak_group(
+    user: settings.AUTH_USER_MODEL, group_name: str, kc_user_id: str | None = None
+) -> bool:
     logger.debug(f"Remove User '{user.username}' from group '{group_name}'.")
-    kc_user_id = _get_keycloak_user_id_from(user)
-    kc_admin = _keycloak_admin()
-    kc_group_id = _get_keycloak_group_id_by_name(kc_admin, group_name)
+    kc_user_id = kc_user_id or _get_keycloak_user_id_from(user)
 
-    #
-    # https://python-keycloak.readthedocs.io/en/v5.8.1/reference/keycloak/keycloak_admin/index.html#keycloak.keycloak_admin.KeycloakAdmin.group_user_remove
-    #
-    kc_admin.group_user_remove(user_id=kc_user_id, group_id=kc_group_id)
+    def remove():
+        kc_admin = _keycloak_admin()
+
+        #
+        # https://python-keycloak.readthedocs.io/en/v5.8.1/reference/keycloak/keycloak_admin/index.html#keycloak.keycloak_admin.KeycloakAdmin.group_user_remove
+        #
+        _call_with_group_id(
+            kc_admin,
+            group_name,
+            lambda kc_group_id: kc_admin.group_user_remove(
+                user_id=kc_user_id, group_id=kc_group_id
+            ),
+        )
+
+    _resilient_call(remove)
     logger.debug(f"Done removing User '{user.username}' from group '{group_name}'.")
 
 
+async def aadd_user_to_keycloak_group(
+    user: settings.AUTH_USER_MODEL, group_name: str, kc_user_id: str | None = None
+) -> None:
+    """
+    Async variant of `add_user_to_keycloak_group` using the `a_*` methods of the admin client.
+    """
+    logger.debug(f"Add User '{user.username}' to group '{group_name}' (async).")
+    kc_user_id = kc_user_id or await sync_to_async(_get_keycloak_user_id_from)(user)
+
+    async def add():
+        kc_admin = await _akeycloak_admin()
+        await _acall_with_group_id(
+            kc_admin,
+            group_name,
+            lambda kc_group_id: kc_admin.a_group_user_add(user_id=kc_user_id, group_id=kc_group_id),
+        )
+
+    await _aresilient_call(add)
+    logger.debug(f"Done adding User '{user.username}' to group '{group_name}' (async).")
+
+
+async def aremove_user_from_keycloak_group(
+    user: settings.AUTH_USER_MODEL, group_name: str, kc_user_id: str | None = None
+) -> None:
+    """
+    Async variant of `remove_user_from_keycloak_group` using the `a_*` methods of the admin client.
+    """
+    logger.debug(f"Remove User '{user.username}' from group '{group_name}' (async).")
+    kc_user_id = kc_user_id or await sync_to_async(_get_keycloak_user_id_from)(user)
+
+    async def remove():
+        kc_admin = await _akeycloak_admin()
+        await _acall_with_group_id(
+            kc_admin,
+            group_name,
+            lambda kc_group_id: kc_admin.a_group_user_remove(
+                user_id=kc_user_id, group_id=kc_group_id
+            ),
+        )
+
+    await _aresilient_call(remove)
+    logger.debug(f"Done removing User '{user.username}' from group '{group_name}' (async).")
+
+
+def iter_keycloak_group_member_ids(group_name: str, page_size: int = 100):
+    """
+    Yields the keycloak user ids of the members of the group page by page.
+    """
+    kc_group_id = _resilient_call(
+        lambda: _get_keycloak_group_id_by_name(_keycloak_admin(), group_name)
+    )
+    first = 0
+    while True:
+        #
+        # https://python-keycloak.readthedocs.io/en/v5.8.1/reference/keycloak/keycloak_admin/index.html#keycloak.keycloak_admin.KeycloakAdmin.get_group_members
+        #
+        members = _resilient_call(
+            lambda first=first: _keycloak_admin().get_group_members(
+                kc_group_id, {"first": first, "max": page_size, "briefRepresentation": True}
+            )
+        )
+        if members:
+            yield [member["id"] for member in members]
+        if len(members) < page_size:
+            break
+        first += page_size
+
+
+def iter_keycloak_users(page_size: int = 100):
+    """
+    Yields the brief representations of the users of the realm page by page.
+    """
+    first = 0
+    while True:
+        #
+        # https://python-keycloak.readthedocs.io/en/v5.8.1/reference/keycloak/keycloak_admin/index.html#keycloak.keycloak_admin.KeycloakAdmin.get_users
+        #
+        users = _resilient_call(
+            lambda first=first: _keycloak_admin().get_users(
+                {"first": first, "max": page_size, "briefRepresentation": True}
+            )
+        )
+        if users:
+            yield users
+        if len(users) < page_size:
+            break
+        first += page_size
+
+
+def mapped_keycloak_groups() -> {str: str}:
+    """
+    The django group names by keycloak group name of all mapped groups. Pattern rules
+    require the names of the existing keycloak groups, hence they are requested then.
+    """
+    mapping = group_mapping()
+    mapped_groups = dict(mapping.to_django_exact.items())
+    if mapping.has_patterns():
+        for kc_group in _resilient_call(lambda: _keycloak_admin().get_groups()):
+            django_group_name = mapping.django_group_name(kc_group["name"])
+            if django_group_name:
+                mapped_groups[kc_group["name"]] = django_group_name
+    return mapped_groups
+
+
+def warm_keycloak_group_id_cache() -> int:
+    """
+    Fills the group id cache from one request listing all groups of the realm.
+
+    Returns the number of cached groups.
+    """
+    found_groups = _resilient_call(lambda: _keycloak_admin().get_groups())
+    _group_id_cache().set_many(
+        {_group_id_cache_key(group["name"]): group["id"] for group in found_groups},
+        timeout=_group_id_cache_timeout(),
+    )
+    logger.debug(f"Cached ids of {len(found_groups)} keycloak groups.")
+    return len(found_groups)
+
+
+def keycloak_circuit_state() -> dict:
+    """
+    State of the circuit breaker guarding the keycloak admin calls of this process.
+    """
+    return _circuit_breaker.state()
+
+
+def invalidate_keycloak_group_id_cache(group_name: str) -> None:
+    logger.debug(f"Invalidate cached id of keycloak group '{group_name}'.")
+    _group_id_cache().delete(_group_id_cache_key(group_name))
+
+
+def _call_with_group_id(kc_admin: KeycloakAdmin, group_name: str, call):
+    kc_group_id = _get_keycloak_group_id_by_name(kc_admin, group_name)
+    try:
+        return call(kc_group_id)
+    except KeycloakError as e:
+        if e.response_code != 404:
+            raise
+        # the cached id may be stale, e.g. because the group was re-created in keycloak
+        logger.debug(f"Keycloak returned 404 for group '{group_name}' ('{kc_group_id}'), retry.")
+        invalidate_keycloak_group_id_cache(group_name)
+        return call(_get_keycloak_group_id_by_name(kc_admin, group_name))
+
+
+async def _acall_with_group_id(kc_admin: KeycloakAdmin, group_name: str, acall):
+    kc_group_id = await _aget_keycloak_group_id_by_name(kc_admin, group_name)
+    try:
+        return await acall(kc_group_id)
+    except KeycloakError as e:
+        if e.response_code != 404:
+            raise
+        logger.debug(f"Keycloak returned 404 for group '{group_name}' ('{kc_group_id}'), retry.")
+        await _group_id_cache().adelete(_group_id_cache_key(group_name))
+        return await acall(await _aget_keycloak_group_id_by_name(kc_admin, group_name))
+
+
 def _get_keycloak_user_id_from(user: settings.AUTH_USER_MODEL) -> str:
-    # throws SocialAccount.DoesNotExist if not found and that is caught in signals._process_sync
-    return SocialAccount.objects.get(user=user).uid
+    # throws SocialAccount.DoesNotExist if not found and that is caught in sync._process_sync
+    return SocialAccount.objects.get(user=user, provider=settings.IDANDSSO_PROVIDER_ID).uid
 
 
 def _get_keycloak_group_id_by_name(kc_admin: KeycloakAdmin, group_name: str) -> str:
-    found_groups = kc_admin.get_groups({"search": group_name})
-    group_id = None
-    for group in found_groups:
-        if group["name"] == group_name:
-            group_id = group["id"]
-            break
+    with timed("keycloak_group_lookup") as observation:
+        cache_key = _group_id_cache_key(group_name)
+        group_id = _group_id_cache().get(cache_key)
+        if group_id:
+            observation.outcome = "cache_hit"
+            return group_id
+
+        found_groups = kc_admin.get_groups({"search": group_name})
+        for group in found_groups:
+            if group["name"] == group_name:
+                group_id = group["id"]
+                break
+
+        if not group_id:
+            invalidate_keycloak_group_id_cache(group_name)
+            raise KeycloakError(f"Could not find group by name '{group_name}'")
+
+        _group_id_cache().set(cache_key, group_id, timeout=_group_id_cache_timeout())
+        return group_id
+
+
+async def _aget_keycloak_group_id_by_name(kc_admin: KeycloakAdmin, group_name: str) -> str:
+    with timed("keycloak_group_lookup") as observation:
+        cache_key = _group_id_cache_key(group_name)
+        group_id = await _group_id_cache().aget(cache_key)
+        if group_id:
+            observation.outcome = "cache_hit"
+            return group_id
+
+        found_groups = await kc_admin.a_get_groups({"search": group_name})
+        for group in found_groups:
+            if group["name"] == group_name:
+                group_id = group["id"]
+                break
+
+        if not group_id:
+            await _group_id_cache().adelete(cache_key)
+            raise KeycloakError(f"Could not find group by name '{group_name}'")
+
+        await _group_id_cache().aset(cache_key, group_id, timeout=_group_id_cache_timeout())
+        return group_id
+
 
-    if not group_id:
-        raise KeycloakError(f"Could not find group by name '{group_name}'")
+def clear_keycloak_group_id_cache() -> None:
+    """
+    Drops the cached ids of all keycloak groups for this process by using new cache keys, the
+    other entries of the shared cache are kept. The old keys expire after their timeout.
+    """
+    global _group_id_cache_generation
+    _group_id_cache_generation += 1
 
-    return group_id
+
+def _group_id_cache():
+    return caches[getattr(settings, "IDANDSSO_GROUP_ID_CACHE_ALIAS", "default")]
+
+
+# part of the cache keys, see clear_keycloak_group_id_cache()
+_group_id_cache_generation = 0
+
+
+def _group_id_cache_key(group_name: str) -> str:
+    realm = settings.IDANDSSO_PROVIDER_REALM
+    return f"idandsso:kc_group_id:{_group_id_cache_generation}:{realm}:{group_name}"
+
+
+def _group_id_cache_timeout() -> int:
+    return getattr(settings, "IDANDSSO_GROUP_ID_CACHE_TIMEOUT", 3600)
+
+
+class CircuitOpenError(KeycloakError):
+    """
+    Raised without calling keycloak, while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after IDANDSSO_KEYCLOAK_CIRCUIT_FAILURE_THRESHOLD consecutive transient errors,
+    hence calls fail fast for IDANDSSO_KEYCLOAK_CIRCUIT_RESET_TIMEOUT seconds. Afterwards,
+    one trial call is let through (half-open), which closes the circuit on success.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+
+    def state(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._state,
+                "failures": self._failures,
+                "opened_at": self._opened_at,
+            }
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            reset_timeout = getattr(settings, "IDANDSSO_KEYCLOAK_CIRCUIT_RESET_TIMEOUT", 30)
+            if self._state == self.OPEN and time.time() - self._opened_at >= reset_timeout:
+                logger.info("Keycloak circuit breaker half-open, trying one call.")
+                self._state = self.HALF_OPEN
+                return
+            raise CircuitOpenError(
+                f"Keycloak circuit breaker is {self._state} after {self._failures} failures"
+            )
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("Keycloak circuit breaker closed.")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            threshold = getattr(settings, "IDANDSSO_KEYCLOAK_CIRCUIT_FAILURE_THRESHOLD", 5)
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._failures >= threshold
+            ):
+                logger.warning(f"Keycloak circuit breaker opened after {self._failures} failures.")
+                self._state = self.OPEN
+                self._opened_at = time.time()
+
+    def record_abort(self) -> None:
+        """
+        Re-opens the circuit, if the trial call ended without a result from keycloak, e.g. by
+        another error or a cancellation, instead of staying half-open.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                logger.warning("Keycloak circuit breaker re-opened after an aborted trial call.")
+                self._state = self.OPEN
+                self._opened_at = time.time()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._opened_at = None
+
+
+_circuit_breaker = CircuitBreaker()
+
+
+def _resilient_call(call):
+    """
+    Calls keycloak guarded by the circuit breaker. Transient errors are retried up to
+    IDANDSSO_KEYCLOAK_RETRIES times with jittered exponential backoff, as long as the
+    IDANDSSO_KEYCLOAK_CALL_DEADLINE is not exceeded.
+    """
+    retries = getattr(settings, "IDANDSSO_KEYCLOAK_RETRIES", 2)
+    backoff = getattr(settings, "IDANDSSO_KEYCLOAK_RETRY_BACKOFF", 0.2)
+    deadline = time.monotonic() + getattr(settings, "IDANDSSO_KEYCLOAK_CALL_DEADLINE", 10)
+    attempt = 0
+    while True:
+        _circuit_breaker.before_call()
+        try:
+            result = call()
+        except KeycloakError as e:
+            if not _is_transient(e):
+                _circuit_breaker.record_success()
+                raise
+            _circuit_breaker.record_failure()
+            delay = random.uniform(0, backoff * 2**attempt)
+            if attempt >= retries or time.monotonic() + delay >= deadline:
+                raise
+            attempt += 1
+            logger.debug(f"Transient keycloak error, retry {attempt} in {delay:.2f}s: {e}")
+            time.sleep(delay)
+        except BaseException:
+            _circuit_breaker.record_abort()
+            raise
+        else:
+            _circuit_breaker.record_success()
+            return result
+
+
+async def _aresilient_call(acall):
+    """
+    Async variant of `_resilient_call`, the backoff does not block the event loop.
+    """
+    retries = getattr(settings, "IDANDSSO_KEYCLOAK_RETRIES", 2)
+    backoff = getattr(settings, "IDANDSSO_KEYCLOAK_RETRY_BACKOFF", 0.2)
+    deadline = time.monotonic() + getattr(settings, "IDANDSSO_KEYCLOAK_CALL_DEADLINE", 10)
+    attempt = 0
+    while True:
+        _circuit_breaker.before_call()
+        try:
+            result = await acall()
+        except KeycloakError as e:
+            if not _is_transient(e):
+                _circuit_breaker.record_success()
+                raise
+            _circuit_breaker.record_failure()
+            delay = random.uniform(0, backoff * 2**attempt)
+            if attempt >= retries or time.monotonic() + delay >= deadline:
+                raise
+            attempt += 1
+            logger.debug(f"Transient keycloak error, retry {attempt} in {delay:.2f}s: {e}")
+            await asyncio.sleep(delay)
+        except BaseException:
+            _circuit_breaker.record_abort()
+            raise
+        else:
+            _circuit_breaker.record_success()
+            return result
+
+
+def _is_transient(error: KeycloakError) -> bool:
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, KeycloakConnectionError):
+        return True
+    return error.response_code is not None and (
+        error.response_code == 429 or error.response_code >= 500
+    )
+
+
+class KeycloakAdminManager:
+    """
+    Process-wide holder of one KeycloakAdmin client.
+
+    The client keeps its requests session, hence the HTTP connections to keycloak are pooled
+    and re-used. The client-credentials token is re-used until `refresh_margin` seconds before
+    it expires and refreshed under a lock, so concurrent threads do not request it twice.
+    After a fork, e.g. in pre-forking WSGI workers, the client is rebuilt in the child.
+
+    The async HTTP client of KeycloakAdmin is bound to an event loop, hence `aget` holds one
+    client per event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._admin = None
+        self._pid = None
+        self._async_admins = LoopLocal(lambda: (_build_keycloak_admin(), asyncio.Lock()))
+
+    def get(self) -> KeycloakAdmin:
+        admin = self._admin
+        if admin is None or self._pid != os.getpid():
+            with self._lock:
+                if self._admin is None or self._pid != os.getpid():
+                    self._admin = _build_keycloak_admin()
+                    self._pid = os.getpid()
+                admin = self._admin
+        self._ensure_token(admin)
+        return admin
+
+    async def aget(self) -> KeycloakAdmin:
+        admin, lock = self._async_admins.get()
+        if self._token_expires_soon(admin):
+            async with lock:
+                if self._token_expires_soon(admin):
+                    logger.debug("Refreshing keycloak admin token (async).")
+                    await admin.connection.a_refresh_token()
+        return admin
+
+    def reset(self) -> None:
+        self._lock = threading.Lock()
+        self._admin = None
+        self._pid = None
+        self._async_admins.clear()
+
+    def _ensure_token(self, admin: KeycloakAdmin) -> None:
+        if not self._token_expires_soon(admin):
+            return
+        with self._lock:
+            if self._token_expires_soon(admin):
+                logger.debug("Refreshing keycloak admin token.")
+                admin.connection.refresh_token()
+
+    @staticmethod
+    def _token_expires_soon(admin: KeycloakAdmin) -> bool:
+        connection = admin.connection
+        if not connection.token or not connection.expires_at:
+            return True
+        # python-keycloak already expires the token at 90% of its lifetime
+        refresh_margin = token_refresh_margin(connection.token.get("expires_in") or 0)
+        return datetime.now(tz=timezone.utc) >= connection.expires_at - timedelta(
+            seconds=refresh_margin
+        )
+
+
+def token_refresh_margin(lifetime: float) -> float:
+    """
+    Seconds before its expiry a token of the given lifetime is refreshed. The margin is at most a
+    tenth of the lifetime, so short-lived tokens are not refreshed on every use.
+    """
+    refresh_margin = getattr(settings, "IDANDSSO_KEYCLOAK_TOKEN_REFRESH_MARGIN", 30)
+    return min(refresh_margin, 0.1 * lifetime)
+
+
+_admin_manager = KeycloakAdminManager()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_admin_manager.reset)
+    os.register_at_fork(after_in_child=_circuit_breaker.reset)
 
 
 def _keycloak_admin() -> KeycloakAdmin:
+    return _admin_manager.get()
+
+
+async def _akeycloak_admin() -> KeycloakAdmin:
+    return await _admin_manager.aget()
+
+
+def _build_keycloak_admin() -> KeycloakAdmin:
     social_app = settings.SOCIALACCOUNT_PROVIDERS["openid_connect"]["APPS"][0]
     client_id = social_app["client_id"]
     client_secret = social_app["secret"]
     realm = settings.IDANDSSO_PROVIDER_REALM
     server_url = settings.IDANDSSO_PROVIDER_HOST
-    return KeycloakAdmin(
+    logger.debug(f"Creating keycloak admin client for realm '{realm}' at '{server_url}'.")
+    admin = KeycloakAdmin(
         server_url=server_url,
         client_id=client_id,
         client_secret_key=client_secret,
         realm_name=realm,
         user_realm_name=realm,
         verify=not settings.DEBUG,
+        timeout=min(
+            getattr(settings, "IDANDSSO_KEYCLOAK_TIMEOUT", 60),
+            getattr(settings, "IDANDSSO_KEYCLOAK_CALL_DEADLINE", 10),
+        ),
     )
+    # the token is requested by the connection of the KeycloakOpenID client
+    instrument_connection(admin.connection)
+    instrument_connection(admin.connection.keycloak_openid.connection)
+    return admin
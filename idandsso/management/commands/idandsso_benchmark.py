@@ -0,0 +1,225 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import platform
+import statistics
+import time
+
+import django
+from allauth.socialaccount.models import SocialAccount
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import (
+    AnonymousUser,
+    Group,
+)
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    override_settings,
+)
+
+from idandsso.adapter import KeycloakOrcidAccountAdapter
+from idandsso.middleware import KeycloakSilentSSOMiddleware
+from idandsso.signals import handle_user_logged_in
+from idandsso.socialaccounts import social_account_scope
+from idandsso.sync import _process_sync
+from idandsso.testing import (
+    FakeKeycloak,
+    isolated_environment,
+    reset_idandsso_state,
+)
+from idandsso.utils import set_sso_hint_cookie
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks login, group sync, logout and middleware against an in-process keycloak "
+        "stand-in. It runs in a test database and a local memory cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200, help="Number of realm users.")
+        parser.add_argument("--groups", type=int, default=5, help="Number of mapped groups.")
+        parser.add_argument(
+            "--latency", type=float, default=5.0, help="Latency per keycloak request in ms."
+        )
+        parser.add_argument("--iterations", type=int, default=50, help="Iterations per benchmark.")
+        parser.add_argument("--output", help="Write the JSON results to this file.")
+        parser.add_argument(
+            "--noinput",
+            "--no-input",
+            action="store_false",
+            dest="interactive",
+            help="Replace an existing test database without asking.",
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        group_map = {f"bench_kc_{i}": f"bench_{i}" for i in range(options["groups"])}
+        with (
+            isolated_environment(interactive=options["interactive"]),
+            FakeKeycloak(latency=options["latency"] / 1000) as kc,
+        ):
+            with (
+                override_settings(
+                    **kc.settings(),
+                    IDANDSSO_GROUP_MAP=group_map,
+                    IDANDSSO_SYNC_OUTBOX=False,
+                ),
+                transaction.atomic(),
+            ):
+                reset_idandsso_state()
+                try:
+                    results = self._run(kc, group_map)
+                finally:
+                    transaction.set_rollback(True)
+            reset_idandsso_state()
+
+        report = {
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": transaction.get_connection().vendor,
+            },
+            "parameters": {
+                key: options[key] for key in ["users", "groups", "latency", "iterations"]
+            },
+            "results": results,
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def _run(self, kc: FakeKeycloak, group_map: dict) -> dict:
+        users = self._create_realm(kc, group_map)
+        kc_groups = list(group_map)
+        user = users[0]
+        social_account = SocialAccount.objects.get(
+            user=user, provider=settings.IDANDSSO_PROVIDER_ID
+        )
+        rf = RequestFactory()
+        results = {}
+
+        def store_groups(groups):
+            social_account.extra_data = {"id_token": {"groups": groups}, "userinfo": {}}
+            social_account.save(update_fields=["extra_data"])
+
+        def login(i):
+            request = rf.get("/")
+            request.user = user
+            request.COOKIES["sso_hint"] = "true"
+            with social_account_scope():
+                handle_user_logged_in(None, request, None, user)
+
+        store_groups(kc_groups[:1])
+        login(0)
+        results["login_unchanged"] = self._measure(login)
+        # the IDP groups are stored before each login, outside of the measured time
+        results["login_changed"] = self._measure(
+            login, prepare=lambda i: store_groups(kc_groups[: 1 + i % len(kc_groups)])
+        )
+
+        kc.reset_requests()
+        results["bulk_sync"] = self._measure(
+            lambda i: _process_sync(users, kc_groups, is_add=i % 2 == 0),
+            iterations=2,
+            operations=len(users) * len(kc_groups),
+        )
+        results["bulk_sync"]["keycloak_requests"] = len(kc.requests)
+
+        adapter_request = rf.post("/accounts/logout/", {"range": "idp-only"})
+        adapter_request.user = AnonymousUser()
+        adapter = KeycloakOrcidAccountAdapter(adapter_request)
+        results["logout_url"] = self._measure(
+            lambda i: adapter.get_logout_redirect_url(adapter_request)
+        )
+
+        response = HttpResponse()
+        set_sso_hint_cookie(rf.get("/"), response)
+        middleware = KeycloakSilentSSOMiddleware(lambda request: HttpResponse())
+
+        def middleware_request(i):
+            request = rf.get("/", HTTP_ACCEPT="text/html")
+            request.COOKIES["sso_hint"] = response.cookies["sso_hint"].value
+            request.user = user
+            middleware(request)
+
+        results["middleware"] = self._measure(middleware_request, iterations=1000)
+        return results
+
+    def _create_realm(self, kc: FakeKeycloak, group_map: dict) -> list:
+        for kc_group, django_group in group_map.items():
+            kc.add_group(kc_group)
+            Group.objects.get_or_create(name=django_group)
+        user_model = get_user_model()
+        users = user_model.objects.bulk_create(
+            [user_model(username=f"idandsso-bench-{i}") for i in range(self.options["users"])]
+        )
+        if not all(user.pk for user in users):
+            users = list(user_model.objects.filter(username__startswith="idandsso-bench-"))
+        SocialAccount.objects.bulk_create(
+            [
+                SocialAccount(
+                    user=user,
+                    provider=settings.IDANDSSO_PROVIDER_ID,
+                    uid=kc.add_user(user.username),
+                    extra_data={"id_token": {"groups": []}, "userinfo": {}},
+                )
+                for user in users
+            ]
+        )
+        return users
+
+    def _measure(
+        self, run, iterations: int | None = None, operations: int = 1, prepare=None
+    ) -> dict:
+        iterations = iterations or self.options["iterations"]
+        durations = []
+        for i in range(iterations):
+            if prepare:
+                prepare(i)
+            started = time.perf_counter()
+            run(i)
+            durations.append(time.perf_counter() - started)
+        durations.sort()
+        total = sum(durations)
+        return {
+            "iterations": iterations,
+            "mean_ms": statistics.mean(durations) * 1000,
+            "p50_ms": durations[len(durations) // 2] * 1000,
+            "p95_ms": durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000,
+            "operations_per_s": iterations * operations / total if total else None,
+        }
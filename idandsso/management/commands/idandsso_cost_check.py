@@ -0,0 +1,291 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+import json
+
+from allauth.socialaccount.models import SocialAccount
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import (
+    AnonymousUser,
+    Group,
+)
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+from django.db import transaction
+from django.test import (
+    RequestFactory,
+    override_settings,
+)
+
+from idandsso.adapter import KeycloakOrcidAccountAdapter
+from idandsso.signals import handle_user_logged_in
+from idandsso.socialaccounts import social_account_scope
+from idandsso.testing import (
+    FakeKeycloak,
+    assert_cost_growth,
+    isolated_environment,
+    record_costs,
+    reset_idandsso_state,
+)
+
+# expected order of growth of the (queries, keycloak requests) per scenario in the number of
+# users N and mapped groups M, see idandsso.testing.cost_growth
+EXPECTED_GROWTH = {
+    "login_unchanged": ("O(1)", "O(1)"),
+    "login_changed": ("O(1)", "O(1)"),
+    "user_save": ("O(1)", "O(1)"),
+    "user_groups_add": ("O(1)", "O(M)"),
+    "group_add": ("O(1)", "O(N)"),
+    "group_remove": ("O(1)", "O(N)"),
+    "group_clear": ("O(1)", "O(N)"),
+    "logout": ("O(1)", "O(1)"),
+}
+
+_STAFF_GROUP = "cost_kc_staff"
+
+
+class Command(BaseCommand):
+    help = (
+        "Counts the database queries and keycloak requests of login, user save, group changes "
+        "and logout for N users and M groups, and fails if they grow faster than expected or "
+        "differ from the given budgets. It runs in a test database and a local memory cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=3, help="Number of users N.")
+        parser.add_argument("--groups", type=int, default=2, help="Number of mapped groups M.")
+        parser.add_argument(
+            "--budgets", help="JSON file of a previous --output, whose counts must match."
+        )
+        parser.add_argument("--output", help="Write the JSON results to this file.")
+        parser.add_argument(
+            "--noinput",
+            "--no-input",
+            action="store_false",
+            dest="interactive",
+            help="Replace an existing test database without asking.",
+        )
+
+    def handle(self, *args, **options):
+        n, m = options["users"], options["groups"]
+        sizes = [(n, m), (2 * n, m), (n, 2 * m), (2 * n, 2 * m)]
+        with isolated_environment(interactive=options["interactive"]):
+            results = measure_costs(sizes)
+
+        failures = check_cost_growth(results, sizes)
+        if options["budgets"]:
+            with open(options["budgets"]) as f:
+                failures += self._check_budgets(results, json.load(f)["results"])
+        output = json.dumps({"parameters": {"users": n, "groups": m}, "results": results}, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
+        if failures:
+            raise CommandError("\n".join(failures))
+
+    def _check_budgets(self, results: dict, budgets: dict) -> [str]:
+        return [
+            f"{scenario} {size}: {costs} instead of {budgets[scenario][size]}"
+            for scenario, costs_by_size in results.items()
+            for size, costs in costs_by_size.items()
+            if scenario in budgets
+            and size in budgets[scenario]
+            and costs != budgets[scenario][size]
+        ]
+
+
+def measure_costs(sizes: [(int, int)]) -> dict:
+    """
+    The queries and keycloak requests of the scenarios by "NxM" for each size of N users and
+    M mapped groups. All database changes are rolled back.
+    """
+    results = {scenario: {} for scenario in EXPECTED_GROWTH}
+    for users, groups in sizes:
+        for scenario, costs in _measure(users, groups).items():
+            results[scenario][f"{users}x{groups}"] = costs
+    return results
+
+
+def check_cost_growth(results: dict, sizes: [(int, int)]) -> [str]:
+    """
+    The scenarios whose costs grow faster than expected.
+    """
+    failures = []
+    for scenario, expected in EXPECTED_GROWTH.items():
+        for metric, expected_growth in zip(["queries", "keycloak_requests"], expected):
+            costs = {size: results[scenario][f"{size[0]}x{size[1]}"][metric] for size in sizes}
+            try:
+                assert_cost_growth(costs, expected_growth)
+            except AssertionError as e:
+                failures.append(f"{scenario} {metric}: {e}")
+    return failures
+
+
+def _measure(users: int, groups: int) -> dict:
+    group_map = {f"cost_kc_{i}": f"cost_{i}" for i in range(groups)}
+    with FakeKeycloak() as kc:
+        with (
+            override_settings(
+                **kc.settings(),
+                IDANDSSO_GROUP_MAP=group_map,
+                IDANDSSO_GROUP_NAME_DJANGO_STAFF=_STAFF_GROUP,
+                IDANDSSO_SYNC_OUTBOX=False,
+                IDANDSSO_SYNC_ASYNC=False,
+            ),
+            transaction.atomic(),
+        ):
+            reset_idandsso_state()
+            try:
+                realm = _Realm(kc, group_map, users)
+                results = {}
+                for scenario in EXPECTED_GROWTH:
+                    # the first run warms up the tokens, group ids and caches
+                    for _ in range(2):
+                        with transaction.atomic():
+                            costs = getattr(realm, scenario)()
+                            transaction.set_rollback(True)
+                    results[scenario] = costs.as_dict()
+            finally:
+                transaction.set_rollback(True)
+        reset_idandsso_state()
+    return results
+
+
+class _Realm:
+    """
+    N users with social accounts and M mapped groups, in the database and the FakeKeycloak,
+    and the scenarios measured with them.
+    """
+
+    def __init__(self, kc: FakeKeycloak, group_map: dict, users: int):
+        self.kc = kc
+        self.kc_groups = list(group_map)
+        for kc_group in [*self.kc_groups, _STAFF_GROUP]:
+            kc.add_group(kc_group)
+        self.groups = [Group.objects.create(name=name) for name in group_map.values()]
+        user_model = get_user_model()
+        self.users = [
+            user_model.objects.create(username=f"idandsso-cost-{i}") for i in range(users)
+        ]
+        SocialAccount.objects.bulk_create(
+            [
+                SocialAccount(
+                    user=user,
+                    provider=settings.IDANDSSO_PROVIDER_ID,
+                    uid=kc.add_user(user.username),
+                    extra_data={"id_token": {"groups": []}, "userinfo": {}},
+                )
+                for user in self.users
+            ]
+        )
+
+    def login_unchanged(self):
+        self.run_committed(self.prepare_login(self.kc_groups))
+        login = self.prepare_login(self.kc_groups)
+        with record_costs(self.kc) as costs:
+            login()
+        return costs
+
+    def login_changed(self):
+        self.run_committed(self.prepare_login([]))
+        login = self.prepare_login(self.kc_groups)
+        with record_costs(self.kc) as costs:
+            login()
+        return costs
+
+    def user_save(self):
+        user = self.reload(self.users[0])
+        user.is_staff = not user.is_staff
+        with record_costs(self.kc) as costs:
+            user.save()
+        return costs
+
+    def user_groups_add(self):
+        user = self.reload(self.users[0])
+        with record_costs(self.kc) as costs:
+            user.groups.add(*self.groups)
+        return costs
+
+    def group_add(self):
+        with record_costs(self.kc) as costs:
+            self.groups[0].user_set.add(*self.users)
+        return costs
+
+    def group_remove(self):
+        self.run_committed(lambda: self.groups[0].user_set.add(*self.users))
+        with record_costs(self.kc) as costs:
+            self.groups[0].user_set.remove(*self.users)
+        return costs
+
+    def group_clear(self):
+        self.run_committed(lambda: self.groups[0].user_set.add(*self.users))
+        with record_costs(self.kc) as costs:
+            self.groups[0].user_set.clear()
+        return costs
+
+    def logout(self):
+        request = RequestFactory().post("/accounts/logout/", {"range": "idp-only"})
+        request.user = AnonymousUser()
+        with record_costs(self.kc) as costs:
+            KeycloakOrcidAccountAdapter(request).get_logout_redirect_url(request)
+        return costs
+
+    def prepare_login(self, kc_groups: [str]):
+        """
+        Stores the IDP groups of the first user and returns its login.
+        """
+        user = self.reload(self.users[0])
+        social_account = SocialAccount.objects.get(
+            user=user, provider=settings.IDANDSSO_PROVIDER_ID
+        )
+        social_account.extra_data = {"id_token": {"groups": kc_groups}, "userinfo": {}}
+        social_account.save(update_fields=["extra_data"])
+        request = RequestFactory().get("/")
+        request.user = user
+        request.COOKIES["sso_hint"] = "true"
+
+        def login():
+            with social_account_scope():
+                handle_user_logged_in(None, request, None, user)
+
+        return login
+
+    def run_committed(self, change) -> None:
+        """
+        Runs the change including the syncs deferred to the commit of the transaction.
+        """
+        with record_costs(self.kc):
+            change()
+
+    def reload(self, user):
+        return get_user_model().objects.get(pk=user.pk)
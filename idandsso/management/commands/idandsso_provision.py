@@ -0,0 +1,228 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import time
+
+from allauth.socialaccount.models import SocialAccount
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from loguru import logger
+
+from idandsso.keycloak import (
+    iter_keycloak_group_member_ids,
+    iter_keycloak_users,
+    mapped_keycloak_groups,
+)
+from idandsso.sync import changes_from_keycloak
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the django users, social accounts and group memberships of the keycloak "
+        "realm users in bulk. Existing users and memberships are kept, hence it can be re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=500,
+            help="Number of users and group members requested from keycloak and created per batch.",
+        )
+        parser.add_argument(
+            "--include-disabled",
+            action="store_true",
+            help="Provision disabled keycloak users, too.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Print the counts without changing the database.",
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        started = time.monotonic()
+        # bulk writes do not send signals, the scope guards any other change against the echo
+        with changes_from_keycloak():
+            counts = self._provision_users()
+            memberships = self._provision_memberships()
+            self._provision_flag("is_staff", settings.IDANDSSO_GROUP_NAME_DJANGO_STAFF)
+            self._provision_flag("is_superuser", settings.IDANDSSO_GROUP_NAME_DJANGO_SUPERUSER)
+        self.stdout.write(
+            f"Total: {counts['created']} users created, {counts['existing']} existing, "
+            f"{counts['conflicts']} username conflicts, {counts['disabled']} disabled, "
+            f"{memberships} memberships created ({time.monotonic() - started:.2f}s)"
+            + (" [dry-run]" if options["dry_run"] else "")
+        )
+
+    def _provision_users(self) -> dict:
+        counts = {"created": 0, "existing": 0, "conflicts": 0, "disabled": 0}
+        for kc_users in iter_keycloak_users(page_size=self.options["page_size"]):
+            if not self.options["include_disabled"]:
+                enabled = [kc_user for kc_user in kc_users if kc_user.get("enabled", True)]
+                counts["disabled"] += len(kc_users) - len(enabled)
+                kc_users = enabled
+            with transaction.atomic():
+                page_counts = self._provision_page(kc_users)
+            for key, count in page_counts.items():
+                counts[key] += count
+        return counts
+
+    def _provision_page(self, kc_users: [dict]) -> dict:
+        user_model = get_user_model()
+        provider = settings.IDANDSSO_PROVIDER_ID
+        existing_uids = set(
+            SocialAccount.objects.filter(
+                provider=provider, uid__in=[kc_user["id"] for kc_user in kc_users]
+            ).values_list("uid", flat=True)
+        )
+        new_kc_users = [kc_user for kc_user in kc_users if kc_user["id"] not in existing_uids]
+        taken_usernames = set(
+            user_model.objects.filter(
+                username__in=[kc_user["username"] for kc_user in new_kc_users]
+            ).values_list("username", flat=True)
+        )
+        for kc_user in new_kc_users:
+            if kc_user["username"] in taken_usernames:
+                # created locally or by another provider, linking it is up to an administrator
+                logger.warning(
+                    f"Skipping keycloak user '{kc_user['id']}', username "
+                    f"'{kc_user['username']}' exists without a social account"
+                )
+        new_kc_users = [
+            kc_user for kc_user in new_kc_users if kc_user["username"] not in taken_usernames
+        ]
+        counts = {
+            "created": len(new_kc_users),
+            "existing": len(existing_uids),
+            "conflicts": len(taken_usernames),
+        }
+        if self.options["dry_run"] or not new_kc_users:
+            return counts
+
+        users = []
+        for kc_user in new_kc_users:
+            user = user_model(
+                username=kc_user["username"],
+                email=kc_user.get("email") or "",
+                first_name=kc_user.get("firstName") or "",
+                last_name=kc_user.get("lastName") or "",
+            )
+            user.set_unusable_password()
+            users.append(user)
+        user_model.objects.bulk_create(users)
+        # not every database backend returns the primary keys of bulk created rows
+        user_ids = dict(
+            user_model.objects.filter(username__in=[user.username for user in users]).values_list(
+                "username", "pk"
+            )
+        )
+        SocialAccount.objects.bulk_create(
+            [
+                SocialAccount(
+                    user_id=user_ids[kc_user["username"]],
+                    provider=provider,
+                    uid=kc_user["id"],
+                    # the claims are unknown until the first login, which is reconciled fully
+                    extra_data={},
+                )
+                for kc_user in new_kc_users
+            ]
+        )
+        return counts
+
+    def _provision_memberships(self) -> int:
+        membership = get_user_model().groups.through
+        created = 0
+        for kc_group_name, django_group_name in mapped_keycloak_groups().items():
+            group = Group.objects.filter(name=django_group_name).first()
+            if not group:
+                logger.error(f"Skipping '{kc_group_name}', group '{django_group_name}' not found")
+                continue
+            try:
+                group_created = self._provision_group(kc_group_name, group, membership)
+            except Exception as e:
+                logger.error(f"Error while provisioning group '{kc_group_name}': {e}")
+                continue
+            self.stdout.write(f"{kc_group_name} -> {django_group_name}: {group_created} added")
+            created += group_created
+        return created
+
+    def _provision_group(self, kc_group_name: str, group: Group, membership) -> int:
+        group_created = 0
+        for kc_user_ids in iter_keycloak_group_member_ids(
+            kc_group_name, page_size=self.options["page_size"]
+        ):
+            user_ids = set(
+                SocialAccount.objects.filter(
+                    provider=settings.IDANDSSO_PROVIDER_ID, uid__in=kc_user_ids
+                ).values_list("user_id", flat=True)
+            )
+            user_ids -= set(
+                membership.objects.filter(group=group, user_id__in=user_ids).values_list(
+                    "user_id", flat=True
+                )
+            )
+            group_created += len(user_ids)
+            if user_ids and not self.options["dry_run"]:
+                # bulk changes of the through table do not send m2m_changed
+                membership.objects.bulk_create(
+                    [membership(user_id=user_id, group=group) for user_id in user_ids],
+                    ignore_conflicts=True,
+                )
+        return group_created
+
+    def _provision_flag(self, field: str, kc_group_name: str) -> None:
+        """
+        Members of the staff and superuser groups get the flag like during login.
+        """
+        user_model = get_user_model()
+        updated = 0
+        try:
+            for kc_user_ids in iter_keycloak_group_member_ids(
+                kc_group_name, page_size=self.options["page_size"]
+            ):
+                users = user_model.objects.filter(
+                    socialaccount__provider=settings.IDANDSSO_PROVIDER_ID,
+                    socialaccount__uid__in=kc_user_ids,
+                    **{field: False},
+                )
+                if self.options["dry_run"]:
+                    updated += users.count()
+                else:
+                    # queryset updates do not send post_save
+                    updated += users.update(**{field: True})
+        except Exception as e:
+            logger.error(f"Could not provision '{field}' from group '{kc_group_name}': {e}")
+        self.stdout.write(f"{kc_group_name} -> {field}: {updated} set")
@@ -0,0 +1,216 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import time
+import uuid
+from datetime import timedelta
+
+from allauth.socialaccount.models import SocialAccount
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand
+from django.db.models import (
+    Exists,
+    OuterRef,
+)
+from django.utils import timezone
+from loguru import logger
+
+from idandsso.keycloak import (
+    iter_keycloak_group_member_ids,
+    mapped_keycloak_groups,
+)
+from idandsso.models import KeycloakGroupMember
+from idandsso.sync import sync_changes
+
+# keycloak members stored longer ago were left by killed runs, as a comparison takes minutes
+STALE_MEMBERS_AGE = timedelta(days=1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the members of all mapped groups between keycloak and django "
+        "and corrects the differences."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            choices=["keycloak", "django"],
+            default="keycloak",
+            help="Side holding the correct memberships: keycloak (like during login) "
+            "corrects django, django corrects keycloak.",
+        )
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=500,
+            help="Number of group members requested from keycloak per page.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Number of django group members compared per query.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Print the differences instead of correcting them.",
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.membership = get_user_model().groups.through
+        started = time.monotonic()
+        self._delete_stale_members()
+        totals = {"only_keycloak": 0, "only_django": 0, "unknown": 0}
+        for kc_group_name, django_group_name in mapped_keycloak_groups().items():
+            group = Group.objects.filter(name=django_group_name).first()
+            if not group:
+                logger.error(f"Skipping '{kc_group_name}', group '{django_group_name}' not found")
+                continue
+            group_started = time.monotonic()
+            try:
+                counts = self._reconcile(kc_group_name, group)
+            except Exception as e:
+                logger.error(f"Error while reconciling group '{kc_group_name}': {e}")
+                continue
+            for key, count in counts.items():
+                totals[key] += count
+            self.stdout.write(
+                f"{kc_group_name} -> {django_group_name}: "
+                f"{counts['only_keycloak']} only in keycloak, "
+                f"{counts['only_django']} only in django, "
+                f"{counts['unknown']} unknown keycloak users "
+                f"({time.monotonic() - group_started:.2f}s)"
+            )
+        self.stdout.write(
+            f"Total: {totals['only_keycloak']} only in keycloak, "
+            f"{totals['only_django']} only in django, "
+            f"{totals['unknown']} unknown keycloak users ({time.monotonic() - started:.2f}s)"
+            + (" [dry-run]" if options["dry_run"] else "")
+        )
+
+    def _delete_stale_members(self) -> None:
+        count, _ = KeycloakGroupMember.objects.filter(
+            created_at__lt=timezone.now() - STALE_MEMBERS_AGE
+        ).delete()
+        if count:
+            logger.warning(f"Deleted {count} keycloak group members left by previous runs")
+
+    def _reconcile(self, kc_group_name: str, group: Group) -> dict:
+        run = uuid.uuid4()
+        try:
+            return self._compare(kc_group_name, group, run)
+        finally:
+            KeycloakGroupMember.objects.filter(run=run).delete()
+
+    def _compare(self, kc_group_name: str, group: Group, run: uuid.UUID) -> dict:
+        #
+        #   the keycloak members are stored page by page and compared in the database, hence
+        #   not kept in memory and not changed while paging
+        #
+        for kc_user_ids in iter_keycloak_group_member_ids(
+            kc_group_name, page_size=self.options["page_size"]
+        ):
+            KeycloakGroupMember.objects.bulk_create(
+                [KeycloakGroupMember(run=run, uid=kc_user_id) for kc_user_id in kc_user_ids],
+                ignore_conflicts=True,
+            )
+        kc_members = KeycloakGroupMember.objects.filter(run=run)
+        social_accounts = SocialAccount.objects.filter(provider=settings.IDANDSSO_PROVIDER_ID)
+        is_kc_member = Exists(kc_members.filter(uid=OuterRef("uid")))
+        return {
+            "only_keycloak": self._correct_in_chunks(
+                kc_group_name,
+                group,
+                social_accounts.filter(is_kc_member).exclude(user__groups=group),
+                is_missing_in_django=True,
+            ),
+            "only_django": self._correct_in_chunks(
+                kc_group_name,
+                group,
+                social_accounts.filter(~is_kc_member, user__groups=group),
+                is_missing_in_django=False,
+            ),
+            "unknown": kc_members.filter(
+                ~Exists(social_accounts.filter(uid=OuterRef("uid")))
+            ).count(),
+        }
+
+    def _correct_in_chunks(
+        self, kc_group_name: str, group: Group, social_accounts, is_missing_in_django: bool
+    ) -> int:
+        # chunked by user id, because correcting the users changes the result of the query
+        user_ids = social_accounts.order_by("user_id").values_list("user_id", flat=True)
+        count, last_user_id = 0, 0
+        while True:
+            chunk = list(user_ids.filter(user_id__gt=last_user_id)[: self.options["chunk_size"]])
+            if not chunk:
+                return count
+            count += len(chunk)
+            self._correct(kc_group_name, group, chunk, is_missing_in_django)
+            last_user_id = chunk[-1]
+
+    def _correct(
+        self, kc_group_name: str, group: Group, user_ids: [int], is_missing_in_django: bool
+    ) -> None:
+        if not user_ids:
+            return
+        from_keycloak = self.options["source"] == "keycloak"
+        if self.options["dry_run"]:
+            if from_keycloak:
+                operation = "add to" if is_missing_in_django else "remove from"
+                target = f"django group '{group.name}'"
+            else:
+                operation = "remove from" if is_missing_in_django else "add to"
+                target = f"keycloak group '{kc_group_name}'"
+            for user_id in user_ids:
+                self.stdout.write(f"  {operation} {target}: user {user_id}")
+            return
+        if from_keycloak and is_missing_in_django:
+            # bulk changes of the through table do not send m2m_changed, hence no echo to keycloak
+            self.membership.objects.bulk_create(
+                [self.membership(user_id=user_id, group=group) for user_id in user_ids],
+                ignore_conflicts=True,
+            )
+        elif from_keycloak:
+            self.membership.objects.filter(group=group, user_id__in=user_ids).delete()
+        else:
+            users = get_user_model().objects.filter(pk__in=user_ids)
+            result = sync_changes(
+                [(user, kc_group_name, not is_missing_in_django) for user in users]
+            )
+            if result.failed:
+                logger.error(
+                    f"Could not sync {len(result.failed)} changes of '{kc_group_name}' to keycloak"
+                )
@@ -0,0 +1,96 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import time
+
+from django.core.management.base import BaseCommand
+from loguru import logger
+
+from idandsso.outbox import (
+    process_batch,
+    queue_depth,
+)
+
+
+class Command(BaseCommand):
+    help = "Syncs the group membership changes stored in the outbox with keycloak."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of outbox entries processed per transaction.",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=10,
+            help="Number of attempts before an entry is marked as failed.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait before polling again, if the outbox is drained.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit after the outbox is drained.",
+        )
+        parser.add_argument(
+            "--queue-depth",
+            action="store_true",
+            help="Print the number of pending outbox entries and exit.",
+        )
+
+    def handle(self, *args, **options):
+        if options["queue_depth"]:
+            self.stdout.write(str(queue_depth()))
+            return
+
+        logger.info("Starting keycloak sync worker")
+        try:
+            while True:
+                processed, failed = process_batch(
+                    batch_size=options["batch_size"], max_attempts=options["max_attempts"]
+                )
+                if processed:
+                    logger.info(
+                        f"Synced {processed - failed} of {processed} outbox entries, "
+                        f"{queue_depth()} pending."
+                    )
+                if processed < options["batch_size"]:
+                    if options["once"]:
+                        break
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            logger.info("Stopping keycloak sync worker")
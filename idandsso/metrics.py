@@ -0,0 +1,146 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+#
+#   counters and latency histograms of the operations depending on the IDP
+#
+#   The backend is configured by IDANDSSO_METRICS_BACKEND, a dotted path to a class providing
+#   `observe(operation, outcome, seconds)`. The default does nothing.
+#
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .diagnostics import record_operation
+
+
+class NoopMetrics:
+    def observe(self, operation: str, outcome: str, seconds: float) -> None:
+        pass
+
+
+class PrometheusMetrics:
+    """
+    Keeps the metrics in memory of the current process and renders them in the Prometheus
+    text format, see the `metrics` view.
+    """
+
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, operation: str, outcome: str, seconds: float) -> None:
+        with self._lock:
+            series = self._series.setdefault(
+                (operation, outcome), {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            )
+            index = bisect_left(self.buckets, seconds)
+            if index < len(self.buckets):
+                series["buckets"][index] += 1
+            series["sum"] += seconds
+            series["count"] += 1
+
+    def render(self) -> str:
+        with self._lock:
+            series = {labels: dict(values) for labels, values in sorted(self._series.items())}
+        lines = [
+            "# HELP idandsso_operations_total Number of operations by outcome.",
+            "# TYPE idandsso_operations_total counter",
+        ]
+        for (operation, outcome), values in series.items():
+            labels = f'operation="{operation}",outcome="{outcome}"'
+            lines.append(f"idandsso_operations_total{{{labels}}} {values['count']}")
+        lines += [
+            "# HELP idandsso_operation_duration_seconds Duration of operations by outcome.",
+            "# TYPE idandsso_operation_duration_seconds histogram",
+        ]
+        for (operation, outcome), values in series.items():
+            labels = f'operation="{operation}",outcome="{outcome}"'
+            cumulative = 0
+            for le, count in zip(self.buckets, values["buckets"]):
+                cumulative += count
+                lines.append(
+                    f'idandsso_operation_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}'
+                )
+            lines += [
+                f'idandsso_operation_duration_seconds_bucket{{{labels},le="+Inf"}} {values["count"]}',
+                f"idandsso_operation_duration_seconds_sum{{{labels}}} {values['sum']}",
+                f"idandsso_operation_duration_seconds_count{{{labels}}} {values['count']}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+_backend = None
+
+
+def metrics():
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, "IDANDSSO_METRICS_BACKEND", None)
+        _backend = import_string(backend_path)() if backend_path else NoopMetrics()
+    return _backend
+
+
+def reset_metrics() -> None:
+    global _backend
+    _backend = None
+
+
+class _Observation:
+    __slots__ = ("outcome",)
+
+    def __init__(self):
+        self.outcome = "success"
+
+
+@contextmanager
+def timed(operation: str):
+    """
+    Observes the duration of the block labelled with its outcome: `success`, `error` if it
+    raises, or the `outcome` set on the yielded object.
+    """
+    observation = _Observation()
+    started = time.perf_counter()
+    try:
+        yield observation
+    except BaseException:
+        observation.outcome = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        metrics().observe(operation, observation.outcome, seconds)
+        record_operation(operation, seconds)
@@ -28,45 +28,126 @@
 #     You should have received a copy of the GNU General Public License
 #     along with this program. If not, see <https://www.gnu.org/licenses/>.
 
+from asgiref.sync import (
+    iscoroutinefunction,
+    markcoroutinefunction,
+    sync_to_async,
+)
 from django.conf import settings
+from django.utils.cache import patch_vary_headers
 from loguru import logger
 
-from .utils import sso_cookie_domain
+from .diagnostics import (
+    is_diagnostics_enabled,
+    report,
+    request_diagnostics,
+)
+from .utils import (
+    SILENT_SSO_VARY_HEADERS,
+    SSO_HINT_COOKIE,
+    has_sso_hint,
+    set_sso_backoff_cookie,
+    set_sso_hint_cookie,
+    sso_cookie_domain,
+    sso_hint_needs_refresh,
+)
 
 
 class KeycloakSilentSSOMiddleware:
     """
     configure using upload_manager.middleware.KeycloakSilentSSOMiddleware
+
+    Sync and async capable, hence it runs without thread hops in ASGI deployments.
     """
 
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        self.skip_path_prefixes = tuple(
+            getattr(
+                settings,
+                "IDANDSSO_SSO_SKIP_PATH_PREFIXES",
+                [
+                    prefix
+                    for prefix in [
+                        getattr(settings, "STATIC_URL", None),
+                        getattr(settings, "MEDIA_URL", None),
+                    ]
+                    if prefix and prefix.startswith("/") and prefix != "/"
+                ],
+            )
+        )
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if is_diagnostics_enabled():
+            with request_diagnostics() as diagnostics:
+                response = self._handle(request)
+            report(request, response, diagnostics)
+            return response
+        return self._handle(request)
+
+    async def __acall__(self, request):
+        if is_diagnostics_enabled():
+            with request_diagnostics(count_queries=False) as diagnostics:
+                response = await self._ahandle(request)
+            report(request, response, diagnostics)
+            return response
+        return await self._ahandle(request)
+
+    def _handle(self, request):
         response = self.get_response(request)
+        if self._process_response(request, response) and request.user.is_authenticated:
+            logger.debug("refreshing sso_hint cookie")
+            set_sso_hint_cookie(request, response)
+        return response
+
+    async def _ahandle(self, request):
+        response = await self.get_response(request)
+        if self._process_response(request, response) and await _ais_authenticated(request):
+            logger.debug("refreshing sso_hint cookie")
+            set_sso_hint_cookie(request, response)
+        return response
+
+    def _process_response(self, request, response) -> bool:
+        """
+        Deletes the sso_hint cookie on logout and records failed logins in the sso_backoff
+        cookie. Otherwise returns, if the sso_hint cookie is to be refreshed
+        in case the user is authenticated, which is checked last as it may query the database.
+        """
+        if getattr(request, "idandsso_silent_sso_decided", False):
+            patch_vary_headers(response, SILENT_SSO_VARY_HEADERS)
+
+        if self.skip_path_prefixes and request.path.startswith(self.skip_path_prefixes):
+            return False
+
+        if request.GET.get("error") and request.path.endswith("/login/callback/"):
+            # the IDP declined the login, e.g. `login_required` for a silent SSO with a stale hint
+            set_sso_backoff_cookie(request, response)
+            return False
 
         if (
             request.method == "POST"
             and "/accounts/logout/" in request.path
-            and request.COOKIES.get("sso_hint") == "true"
+            and has_sso_hint(request)
         ):
             logger.debug("deleting cookie")
-            response.delete_cookie("sso_hint", domain=sso_cookie_domain(), path="/")
-
-        elif request.user.is_authenticated:
-            sso_cookie_max_age = getattr(settings, "SESSION_COOKIE_AGE", 3600)
-
-            if "text/html" in request.META.get("HTTP_ACCEPT", ""):
-                logger.debug("refreshing sso_hint cookie")
-                response.set_cookie(
-                    "sso_hint",
-                    "true",
-                    domain=sso_cookie_domain(),
-                    max_age=sso_cookie_max_age,
-                    samesite="Lax",
-                    path="/",
-                    secure=request.is_secure(),
-                    httponly=False,
-                )
+            response.delete_cookie(SSO_HINT_COOKIE, domain=sso_cookie_domain(), path="/")
+            return False
 
-        return response
+        return "text/html" in request.META.get("HTTP_ACCEPT", "") and sso_hint_needs_refresh(
+            request
+        )
+
+
+async def _ais_authenticated(request) -> bool:
+    if hasattr(request, "auser"):
+        # django >= 5.0
+        return (await request.auser()).is_authenticated
+    # the lazy user is loaded from the session on first access
+    return await sync_to_async(lambda: request.user.is_authenticated)()
@@ -0,0 +1,128 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from allauth.socialaccount.models import SocialAccount
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class KeycloakSyncIntent(models.Model):
+    """
+    Outbox entry for one keycloak group membership change, processed by the
+    `idandsso_sync_worker` management command.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="keycloak_sync_intents",
+        verbose_name=_("user"),
+    )
+    group_name = models.CharField(_("keycloak group name"), max_length=255)
+    is_add = models.BooleanField(_("add to group"))
+    attempts = models.PositiveIntegerField(_("attempts"), default=0)
+    available_at = models.DateTimeField(_("available at"), default=timezone.now)
+    failed_at = models.DateTimeField(_("failed at"), null=True, blank=True)
+    claimed_until = models.DateTimeField(_("claimed until"), null=True, blank=True)
+    last_error = models.TextField(_("last error"), blank=True)
+    created_at = models.DateTimeField(_("created at"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("keycloak sync intent")
+        verbose_name_plural = _("keycloak sync intents")
+        indexes = [
+            models.Index(fields=["failed_at", "available_at"]),
+        ]
+
+    def __str__(self):
+        operation = "add" if self.is_add else "remove"
+        return f"{operation} user '{self.user_id}' / group '{self.group_name}'"
+
+
+class LoginClaimsFingerprint(models.Model):
+    """
+    Hash of the claims a social account was reconciled with during its last login.
+    """
+
+    social_account = models.OneToOneField(
+        SocialAccount,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="idandsso_claims_fingerprint",
+        verbose_name=_("social account"),
+    )
+    digest = models.CharField(_("digest"), max_length=64)
+    reconciled_at = models.DateTimeField(_("reconciled at"), default=timezone.now)
+
+    class Meta:
+        verbose_name = _("login claims fingerprint")
+        verbose_name_plural = _("login claims fingerprints")
+
+    def __str__(self):
+        return f"social account '{self.social_account_id}' / {self.digest[:12]}"
+
+
+class KeycloakEventReceipt(models.Model):
+    """
+    Id of a keycloak admin event received by the webhook, to apply every event once.
+    """
+
+    event_id = models.CharField(_("event id"), max_length=255, primary_key=True)
+    received_at = models.DateTimeField(_("received at"), default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = _("keycloak event receipt")
+        verbose_name_plural = _("keycloak event receipts")
+
+    def __str__(self):
+        return self.event_id
+
+
+class KeycloakGroupMember(models.Model):
+    """
+    Keycloak user id of a group member, stored by the `idandsso_reconcile` command during one
+    comparison of the group, so the members are not kept in memory.
+    """
+
+    run = models.UUIDField(_("run"))
+    uid = models.CharField(_("keycloak user id"), max_length=255)
+    created_at = models.DateTimeField(_("created at"), default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = _("keycloak group member")
+        verbose_name_plural = _("keycloak group members")
+        constraints = [
+            models.UniqueConstraint(fields=["run", "uid"], name="idandsso_unique_run_member"),
+        ]
+
+    def __str__(self):
+        return f"run '{self.run}' / user '{self.uid}'"
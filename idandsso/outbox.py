@@ -0,0 +1,175 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+#
+#   durable outbox for keycloak group membership changes, drained by the
+#   `idandsso_sync_worker` management command
+#
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    Exists,
+    OuterRef,
+)
+from django.utils import timezone
+from loguru import logger
+
+from .keycloak import (
+    add_user_to_keycloak_group,
+    remove_user_from_keycloak_group,
+)
+from .models import KeycloakSyncIntent
+from .socialaccounts import get_social_account_uids
+
+
+def is_outbox_enabled() -> bool:
+    return getattr(settings, "IDANDSSO_SYNC_OUTBOX", False)
+
+
+def enqueue_sync_intents(
+    users: (settings.AUTH_USER_MODEL), keycloak_group_names: (str), is_add: bool
+) -> None:
+    """
+    Stores the changes in the outbox, within the current transaction if any.
+
+    Pending intents of the same (user, group) pairs, which are not being processed by a worker,
+    are replaced, so the latest change of a pair wins.
+    """
+    users = list(users)
+    keycloak_group_names = list(keycloak_group_names)
+    KeycloakSyncIntent.objects.filter(
+        user__in=users, group_name__in=keycloak_group_names, failed_at__isnull=True
+    ).exclude(claimed_until__gt=timezone.now()).delete()
+    KeycloakSyncIntent.objects.bulk_create(
+        [
+            KeycloakSyncIntent(user=user, group_name=group_name, is_add=is_add)
+            for user in users
+            for group_name in keycloak_group_names
+        ]
+    )
+    logger.debug(
+        f"Added {len(users) * len(keycloak_group_names)} group membership changes to the "
+        "keycloak sync outbox"
+    )
+
+
+def queue_depth() -> int:
+    return KeycloakSyncIntent.objects.filter(failed_at__isnull=True).count()
+
+
+def process_batch(batch_size: int = 100, max_attempts: int = 10) -> (int, int):
+    """
+    Syncs the due intents of the outbox with keycloak.
+
+    The intents are claimed for `IDANDSSO_SYNC_OUTBOX_LEASE` seconds in a short transaction,
+    skipping rows locked by other workers, and synced after its commit. Intents of a (user,
+    group) pair are synced in order, hence several workers can run in parallel.
+    Successful intents are deleted. Failed ones are retried with exponential backoff until
+    `max_attempts` is reached, then they are marked as failed and kept for inspection, unless a
+    newer intent of the pair supersedes them.
+
+    Returns the number of processed and of failed intents.
+    """
+    processed, failed = 0, 0
+    intents = _claim_batch(batch_size)
+    kc_user_ids = get_social_account_uids({intent.user for intent in intents})
+    done = []
+    for intent in intents:
+        processed += 1
+        kc_user_id = kc_user_ids.get(intent.user_id)
+        try:
+            if kc_user_id and intent.is_add:
+                add_user_to_keycloak_group(intent.user, intent.group_name, kc_user_id)
+            elif kc_user_id:
+                remove_user_from_keycloak_group(intent.user, intent.group_name, kc_user_id)
+            done.append(intent.pk)
+        except Exception as e:
+            failed += 1
+            _schedule_retry(intent, e, max_attempts)
+    KeycloakSyncIntent.objects.filter(pk__in=done).delete()
+    return processed, failed
+
+
+def _claim_batch(batch_size: int) -> [KeycloakSyncIntent]:
+    now = timezone.now()
+    pending = KeycloakSyncIntent.objects.filter(failed_at__isnull=True)
+    older = pending.filter(
+        user=OuterRef("user"), group_name=OuterRef("group_name"), pk__lt=OuterRef("pk")
+    )
+    with transaction.atomic():
+        intents = list(
+            pending.select_for_update(skip_locked=True, of=("self",))
+            .select_related("user")
+            .filter(~Exists(older), available_at__lte=now)
+            .exclude(claimed_until__gt=now)
+            .order_by("pk")[:batch_size]
+        )
+        KeycloakSyncIntent.objects.filter(pk__in=[intent.pk for intent in intents]).update(
+            claimed_until=now + timedelta(seconds=_lease())
+        )
+    return intents
+
+
+def _schedule_retry(intent: KeycloakSyncIntent, error: Exception, max_attempts: int) -> None:
+    newer = KeycloakSyncIntent.objects.filter(
+        user_id=intent.user_id,
+        group_name=intent.group_name,
+        failed_at__isnull=True,
+        pk__gt=intent.pk,
+    )
+    if newer.exists():
+        logger.warning(f"Error while syncing '{intent}' with keycloak, superseded: {error}")
+        intent.delete()
+        return
+    intent.attempts += 1
+    intent.last_error = str(error)
+    intent.claimed_until = None
+    if intent.attempts >= max_attempts:
+        logger.error(f"Giving up syncing '{intent}' with keycloak: {error}")
+        intent.failed_at = timezone.now()
+    else:
+        logger.warning(f"Error while syncing '{intent}' with keycloak, will retry: {error}")
+        intent.available_at = timezone.now() + _backoff(intent.attempts)
+    intent.save(
+        update_fields=["attempts", "last_error", "failed_at", "available_at", "claimed_until"]
+    )
+
+
+def _backoff(attempts: int) -> timedelta:
+    base = getattr(settings, "IDANDSSO_SYNC_OUTBOX_RETRY_BACKOFF", 5)
+    maximum = getattr(settings, "IDANDSSO_SYNC_OUTBOX_RETRY_BACKOFF_MAX", 3600)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), maximum))
+
+
+def _lease() -> int:
+    return getattr(settings, "IDANDSSO_SYNC_OUTBOX_LEASE", 600)
@@ -36,6 +36,8 @@
 #       https://docs.allauth.org/en/dev/socialaccount/signals.html
 #
 
+from datetime import timedelta
+
 from allauth.account.signals import user_logged_in
 from allauth.socialaccount.models import SocialAccount
 from django.conf import settings
@@ -44,19 +46,59 @@ from django.contrib.auth.models import (
     Group,
     User,
 )
-from django.db import transaction
+from django.core.signals import (
+    request_finished,
+    request_started,
+    setting_changed,
+)
 from django.db.models.signals import (
     m2m_changed,
+    post_delete,
+    post_init,
     post_save,
 )
 from django.dispatch import receiver
+from django.utils import timezone
 from loguru import logger
 
-from .keycloak import (
-    add_user_to_keycloak_group,
-    remove_user_from_keycloak_group,
+from .claims import (
+    claims_projection,
+    reset_claims_projection,
+)
+from .groupindex import (
+    group_names,
+    invalidate_group_index,
+)
+from .groupmap import (
+    group_mapping,
+    reset_group_mapping,
+)
+from .metrics import (
+    reset_metrics,
+    timed,
+)
+from .models import LoginClaimsFingerprint
+from .socialaccounts import (
+    begin_social_account_scope,
+    end_social_account_scope,
+    forget_social_account,
+    get_social_account,
+    is_social_account,
+)
+from .sync import (
+    changes_from_keycloak,
+    is_change_from_keycloak,
+    schedule_sync,
+)
+from .utils import (
+    SSO_HINT_COOKIE,
+    begin_request,
+    bot_user_agent_pattern,
+    delete_sso_backoff_cookie,
+    end_request,
+    set_sso_hint_cookie,
+    sso_cookie_domain,
 )
-from .utils import sso_cookie_domain
 
 
 @receiver(signal=user_logged_in)
@@ -65,53 +107,33 @@ def handle_user_logged_in(sender, request, response, user, **kwargs):
     - receives local and social logins
       - later after social_account_updated
     - ensure group membership
-    - ensure staff and superuser status
+    - ensure the fields projected from the claims, e.g. staff and superuser status
     """
     logger.debug("signal 'user_logged_in' received")
-    if not _is_social_account(user):
+    social_user = get_social_account(user)
+    if not social_user:
         return
-    social_user = SocialAccount.objects.get(user=user)
-    social_groups = (
-        set(social_user.extra_data.get("id_token").get("groups"))
-        if social_user.extra_data.get("id_token").get("groups")
-        else set()
-    )
-    affiliation = (
-        social_user.extra_data.get("userinfo").get("affiliation")
-        if social_user.extra_data.get("userinfo").get("affiliation")
-        else {}
-    )
-
-    _ensure_staff_and_superuser_status(user, social_groups)
-    _ensure_user_affiliation(user, affiliation)
-
-    # local_groups: currently assigned groups in django
-    local_groups = set(user.groups.values_list("name", flat=True))
-    # social_groups: groups assigned in keycloak (mapped to django group names)
-    social_groups = _map_social_groups(social_groups)
-    groups_to_add = social_groups - local_groups
-    groups_to_remove = local_groups - social_groups
-    if groups_to_add:
-        _add_user_to_groups(user, groups_to_add)
-    if groups_to_remove:
-        _remove_user_from_groups(user, groups_to_remove)
+    extra_data = social_user.extra_data
+    fingerprint = claims_projection().fingerprint(extra_data)
+    if _is_reconciled(social_user, fingerprint):
+        logger.debug(f"Claims of user '{user.username}' unchanged, skip reconciliation")
+    elif _reconcile_login(user, extra_data):
+        _store_fingerprint(social_user, fingerprint)
     #
     #   set cookie for single sign on
     #
-    if response and "sso_hint" not in request.COOKIES:
-        domain = sso_cookie_domain()
-        max_age = getattr(settings, "SESSION_COOKIE_AGE", 3600)
-        logger.debug(f"Domain for cookie: '{domain}'")
-        response.set_cookie(
-            "sso_hint",
-            "true",
-            domain=domain,
-            max_age=max_age,
-            samesite="Lax",
-            path="/",
-            secure=request.is_secure(),
-            httponly=False,
-        )
+    if response and SSO_HINT_COOKIE not in request.COOKIES:
+        set_sso_hint_cookie(request, response)
+    if response:
+        delete_sso_backoff_cookie(request, response)
+
+
+@receiver(signal=post_init, sender=settings.AUTH_USER_MODEL)
+def snapshot_synced_flags(sender, instance, **kwargs):
+    """
+    Keeps the loaded staff and superuser flags, so saves sync their transitions only.
+    """
+    _snapshot_synced_flags(instance)
 
 
 @receiver(signal=post_save, sender=settings.AUTH_USER_MODEL)
@@ -119,30 +141,36 @@ def handle_group_updates_post_save(sender, instance, **kwargs):
     """
     https://docs.djangoproject.com/en/5.1/ref/signals/#post-save
     """
-    if (
-        not _is_social_account(instance)
-        or _is_login_event(kwargs.get("update_fields"))
-        or getattr(instance, "_skip_keycloak_sync_because_of_login", False)
-    ):
+    update_fields = kwargs.get("update_fields")
+    if update_fields is not None and not set(update_fields) & _SYNCED_FLAGS.keys():
         return
-    logger.debug(f"post_save signal received from '{sender}' for '{instance}'")
+    snapshot = getattr(instance, "_idandsso_synced_flags", {})
+    saved_flags = {
+        field: getattr(instance, field)
+        for field in _SYNCED_FLAGS
+        if update_fields is None or field in update_fields
+    }
+    instance._idandsso_synced_flags = {**snapshot, **saved_flags}
+    # flags missing in the snapshot, e.g. of created users or deferred fields, are synced
+    changed_flags = {
+        field: value for field, value in saved_flags.items() if snapshot.get(field) != value
+    }
+    if not changed_flags or is_change_from_keycloak() or not is_social_account(instance):
+        return
+    logger.debug(f"post_save signal received from '{sender}' for '{instance}': {changed_flags}")
     add_groups = []
     remove_groups = []
-    # update superuser group
-    if instance.is_superuser:
-        add_groups += [settings.IDANDSSO_GROUP_NAME_DJANGO_SUPERUSER]
-    else:
-        remove_groups += [settings.IDANDSSO_GROUP_NAME_DJANGO_SUPERUSER]
-    # update staff group
-    if instance.is_staff:
-        add_groups += [settings.IDANDSSO_GROUP_NAME_DJANGO_STAFF]
-    else:
-        remove_groups += [settings.IDANDSSO_GROUP_NAME_DJANGO_STAFF]
+    for field, value in changed_flags.items():
+        group_name = getattr(settings, _SYNCED_FLAGS[field])
+        if value:
+            add_groups += [group_name]
+        else:
+            remove_groups += [group_name]
     # trigger processing
     if len(add_groups) > 0:
-        transaction.on_commit(lambda: _process_sync([instance], add_groups, is_add=True))
+        schedule_sync([instance], add_groups, is_add=True)
     if len(remove_groups) > 0:
-        transaction.on_commit(lambda: _process_sync([instance], remove_groups, is_add=False))
+        schedule_sync([instance], remove_groups, is_add=False)
     # updating groups is done in sync_group_changes_with_keycloak()
 
 
@@ -151,6 +179,9 @@ def sync_group_changes_with_keycloak(sender, instance, action, pk_set, reverse,
     """
     https://docs.djangoproject.com/en/5.1/ref/signals/#m2m-changed
     """
+    if is_change_from_keycloak():
+        # e.g. login or admin events, the targets are not resolved just to be dropped
+        return
     if action in ["post_add", "post_remove"]:
         logger.debug(
             f"m2m_changed.(post_add|post_remove) signal received from '{sender}' for '{instance}'"
@@ -158,167 +189,170 @@ def sync_group_changes_with_keycloak(sender, instance, action, pk_set, reverse,
         is_add = action == "post_add"
         users, groups = _get_targets(instance, pk_set, reverse)
         # Trigger sync after successful DB commit
-        transaction.on_commit(lambda: _process_sync(users, groups, is_add=is_add))
+        schedule_sync(users, groups, is_add=is_add)
     elif action == "pre_clear":
         logger.debug(f"m2m_changed.pre_clear signal received from '{sender}' for '{instance}'")
-        groups, users = None, None
         if reverse:
-            groups = [instance]
-            users = list(instance.user_set.all())
+            pk_set = set(instance.user_set.values_list("pk", flat=True))
         else:
-            users = [instance]
-            groups = list(instance.groups.all())
+            pk_set = set(instance.groups.values_list("pk", flat=True))
+        users, groups = _get_targets(instance, pk_set, reverse)
+        schedule_sync(users, groups, is_add=False)
 
-        transaction.on_commit(lambda: _process_sync(users, groups, is_add=False))
 
+@receiver(signal=request_started)
+def begin_request_social_account_scope(sender, **kwargs):
+    begin_social_account_scope()
+    # django's ASGI handler passes the scope, the WSGI handler the environ
+    begin_request(is_asgi="scope" in kwargs)
 
-def _ensure_staff_and_superuser_status(user, social_groups):
-    logger.debug(f"_ensure_staff_and_superuser_status({user.username}, {social_groups})")
-    update_fields = []
-    is_django_staff = settings.IDANDSSO_GROUP_NAME_DJANGO_STAFF in social_groups
-    is_django_staff_before = user.is_staff
-    if is_django_staff != is_django_staff_before:
-        user.is_staff = is_django_staff
-        update_fields += ["is_staff"]
 
-    is_django_superuser = settings.IDANDSSO_GROUP_NAME_DJANGO_SUPERUSER in social_groups
-    is_django_superuser_before = user.is_superuser
-    if is_django_superuser != is_django_superuser_before:
-        user.is_superuser = is_django_superuser
-        update_fields += ["is_superuser"]
+@receiver(signal=request_finished)
+def end_request_social_account_scope(sender, **kwargs):
+    end_social_account_scope()
+    end_request()
 
-    if len(update_fields) > 0:
-        user._skip_keycloak_sync_because_of_login = True
-        user.save(update_fields=update_fields)
 
+@receiver(signal=post_save, sender=SocialAccount)
+@receiver(signal=post_delete, sender=SocialAccount)
+def forget_memoised_social_account(sender, instance, **kwargs):
+    forget_social_account(instance.user_id)
 
-def _ensure_user_affiliation(user, affiliation):
-    """
-    Using ORCID API affiliation
 
-    See https://github.com/ORCID/orcid-model
+@receiver(signal=post_save, sender=Group)
+@receiver(signal=post_delete, sender=Group)
+def invalidate_memoised_groups(sender, instance, **kwargs):
+    invalidate_group_index()
+
+
+@receiver(signal=setting_changed)
+def clear_memoised_settings(sender, setting, **kwargs):
+    if setting in ["SITE_URL", "SITEURL"]:
+        sso_cookie_domain.cache_clear()
+    elif setting == "IDANDSSO_SSO_BOT_USER_AGENT_PATTERN":
+        bot_user_agent_pattern.cache_clear()
+    elif setting in ["IDANDSSO_GROUP_INDEX_CACHE_ALIAS", "IDANDSSO_GROUP_INDEX_TIMEOUT"]:
+        invalidate_group_index()
+    elif setting == "IDANDSSO_METRICS_BACKEND":
+        reset_metrics()
+    elif setting in [
+        "IDANDSSO_GROUP_MAP",
+        "IDANDSSO_GROUP_NAME_DJANGO_STAFF",
+        "IDANDSSO_GROUP_NAME_DJANGO_SUPERUSER",
+    ]:
+        reset_group_mapping()
+    elif setting == "IDANDSSO_CLAIMS_MAP":
+        reset_claims_projection()
+
+
+def _reconcile_login(user, extra_data) -> bool:
     """
-    logger.debug(f"_ensure_user_affiliation({user.username}, affiliation)")
-    org_name = (
-        affiliation.get("organization").get("name") if affiliation.get("organization") else None
-    )
-    if not org_name:
-        logger.debug("end processing affiliation information, because no org_name is found.")
-        return
-    org_ror = (
-        affiliation.get("organization")
-        .get("disambiguated-organization")
-        .get("disambiguated-organization-identifier")
-        if affiliation.get("organization")
-        and affiliation.get("organization").get("disambiguated-organization")
-        and affiliation.get("organization")
-        .get("disambiguated-organization")
-        .get("disambiguation-source")
-        and affiliation.get("organization")
-        .get("disambiguated-organization")
-        .get("disambiguation-source")
-        == "ROR"
-        else None
-    )
-    logger.debug(f"Found affiliation: '{org_name}' ('{org_ror}')")
-    update_fields = []
-    if user.organization != org_name:
-        user.organization = org_name
-        update_fields += ["organization"]
-    if user.rorlink != org_ror:
-        user.rorlink = org_ror
-        update_fields += ["rorlink"]
-
-    if len(update_fields) > 0:
-        user._skip_keycloak_sync_because_of_login = True
-        user.save(update_fields=update_fields)
-
-
-def _map_social_groups(social_groups):
-    if settings.IDANDSSO_GROUP_MAP:
-        mapped_groups = set()
-        for social_group in social_groups:
-            if social_group in [
-                settings.IDANDSSO_GROUP_NAME_DJANGO_STAFF,
-                settings.IDANDSSO_GROUP_NAME_DJANGO_SUPERUSER,
-            ]:
-                continue
-            mapped_group = settings.IDANDSSO_GROUP_MAP.get(social_group)
-            if not mapped_group:
-                logger.error(f"No mapping found for social group '{social_group}'")
-            else:
-                mapped_groups.add(mapped_group)
-        social_groups = mapped_groups
-    return social_groups
-
-
-def _add_user_to_groups(user, groups_to_add):
-    logger.debug(f"_add_user_to_groups({user.username}, {groups_to_add})")
-    django_groups_to_add = list(Group.objects.filter(name__in=groups_to_add))
-    user.groups.add(*django_groups_to_add)
-    added_group_names = {g.name for g in django_groups_to_add}
-    logger.debug(f"Added user '{user.username}' to groups: '{added_group_names}'")
-    missing_groups = groups_to_add - added_group_names
-    if missing_groups:
-        logger.error(
-            f"Could not add user '{user.username}' to '{missing_groups}' because they do NOT EXIST."
+    Returns whether the user was reconciled completely, i.e. all groups to add exist.
+    """
+    social_groups = set((extra_data.get("id_token") or {}).get("groups") or ())
+
+    # the changes come from keycloak, hence they must not be synced back
+    with timed("login"), changes_from_keycloak():
+        _apply_claims(user, extra_data)
+
+        # local_groups: currently assigned groups in django
+        # read with the names of the groups, groups may be renamed or re-created elsewhere
+        local_group_pks = dict(
+            _membership().objects.filter(user_id=user.pk).values_list("group__name", "group_id")
         )
+        local_groups = set(local_group_pks)
+        # social_groups: groups assigned in keycloak (mapped to django group names)
+        social_groups = group_mapping().django_group_names(social_groups)
+        groups_to_add = social_groups - local_groups
+        groups_to_remove = local_groups - social_groups
+        is_complete = True
+        if groups_to_add:
+            is_complete = _add_user_to_groups(user, groups_to_add)
+        if groups_to_remove:
+            _remove_user_from_groups(
+                user, {name: local_group_pks[name] for name in groups_to_remove}
+            )
+    return is_complete
+
+
+def _is_reconciled(social_user, fingerprint: str) -> bool:
+    stored = getattr(social_user, "idandsso_claims_fingerprint", None)
+    if stored is None or stored.digest != fingerprint:
+        return False
+    interval = getattr(settings, "IDANDSSO_LOGIN_RECONCILE_INTERVAL", 86400)
+    if interval is None:
+        return True
+    return timezone.now() - stored.reconciled_at < timedelta(seconds=interval)
+
+
+def _store_fingerprint(social_user, fingerprint: str):
+    stored = getattr(social_user, "idandsso_claims_fingerprint", None)
+    if stored is None:
+        # concurrent first logins of the account, e.g. in two tabs, may both create it
+        social_user.idandsso_claims_fingerprint, _ = (
+            LoginClaimsFingerprint.objects.update_or_create(
+                social_account=social_user,
+                defaults={"digest": fingerprint, "reconciled_at": timezone.now()},
+            )
+        )
+    else:
+        stored.digest = fingerprint
+        stored.reconciled_at = timezone.now()
+        stored.save(update_fields=["digest", "reconciled_at"])
+
+
+def _apply_claims(user, extra_data):
+    changed_fields = claims_projection().project(user, extra_data)
+    if changed_fields:
+        user.save(update_fields=changed_fields)
+
 
+# user flags synced with keycloak and the settings naming their keycloak groups
+_SYNCED_FLAGS = {
+    "is_staff": "IDANDSSO_GROUP_NAME_DJANGO_STAFF",
+    "is_superuser": "IDANDSSO_GROUP_NAME_DJANGO_SUPERUSER",
+}
 
-def _remove_user_from_groups(user, groups_to_remove):
-    logger.debug(f"_remove_user_from_groups({user.username}, {groups_to_remove})")
-    django_groups_to_remove = list(Group.objects.filter(name__in=groups_to_remove))
-    user.groups.remove(*django_groups_to_remove)
-    removed_group_names = {g.name for g in django_groups_to_remove}
-    logger.debug(f"Remove '{user.username}' from groups: '{removed_group_names}'")
-    missing_groups = groups_to_remove - removed_group_names
+
+def _snapshot_synced_flags(user):
+    # deferred fields are not loaded, hence not part of the snapshot
+    user._idandsso_synced_flags = {
+        field: user.__dict__[field] for field in _SYNCED_FLAGS if field in user.__dict__
+    }
+
+
+def _add_user_to_groups(user, groups_to_add) -> bool:
+    logger.debug(f"_add_user_to_groups({user.username}, {groups_to_add})")
+    # resolved by name, as the group index of this process may be stale
+    group_pks_to_add = dict(Group.objects.filter(name__in=groups_to_add).values_list("name", "pk"))
+    user.groups.add(*group_pks_to_add.values())
+    logger.debug(f"Added user '{user.username}' to groups: '{set(group_pks_to_add)}'")
+    missing_groups = groups_to_add - group_pks_to_add.keys()
     if missing_groups:
         logger.error(
-            f"Could not remove user '{user.username}' from '{missing_groups}' because they do NOT EXIST."
+            f"Could not add user '{user.username}' to '{missing_groups}' because they do NOT EXIST."
         )
+    return not missing_groups
 
 
-def _is_login_event(updated_fields: frozenset) -> bool:
-    if updated_fields and len(updated_fields) == 1 and "last_login" in updated_fields:
-        return True
-    return False
-
-
-def _is_social_account(user: settings.AUTH_USER_MODEL) -> bool:
-    try:
-        SocialAccount.objects.get(user=user)
-        return True
-    except SocialAccount.DoesNotExist:
-        return False
-    return False
+def _remove_user_from_groups(user, group_pks_to_remove: {str: int}):
+    logger.debug(f"_remove_user_from_groups({user.username}, {set(group_pks_to_remove)})")
+    user.groups.remove(*group_pks_to_remove.values())
+    logger.debug(f"Remove '{user.username}' from groups: '{set(group_pks_to_remove)}'")
 
 
-IDANDSSO_GROUP_MAP_REVERSE = {v: k for k, v in settings.IDANDSSO_GROUP_MAP.items()}
+def _membership():
+    return get_user_model().groups.through
 
 
-def _get_targets(instance, pk_set: (int), reverse: bool) -> ((settings.AUTH_USER_MODEL), (Group)):
+def _get_targets(instance, pk_set: (int), reverse: bool) -> ((settings.AUTH_USER_MODEL), (str)):
     if reverse:
         # Change via group (Group Admin) -> instance is group
-        groups = [instance]
-        users = User.objects.filter(pk__in=pk_set)
+        keycloak_group_names = group_mapping().keycloak_group_names([instance.name])
+        # unmapped groups are not synced, hence the users are not required
+        users = User.objects.filter(pk__in=pk_set) if keycloak_group_names else []
     else:
         # Change via User (User Admin) -> instance is User
         users = [instance]
-        groups = Group.objects.filter(pk__in=pk_set)
-    keycloak_group_names = {IDANDSSO_GROUP_MAP_REVERSE.get(g.name) for g in groups}
+        keycloak_group_names = group_mapping().keycloak_group_names(group_names(pk_set).values())
     return users, keycloak_group_names
-
-
-def _process_sync(
-    users: (settings.AUTH_USER_MODEL), keycloak_group_names: (str), is_add: bool
-) -> None:
-    for user in users:
-        if _is_social_account(user):
-            for group_name in keycloak_group_names:
-                try:
-                    if is_add:
-                        add_user_to_keycloak_group(user, group_name)
-                    else:
-                        remove_user_from_keycloak_group(user, group_name)
-                except Exception as e:
-                    logger.error(f"Error while syncing groups with keycloak: {e}")
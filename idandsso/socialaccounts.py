@@ -0,0 +1,118 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+#
+#   memoised lookup of the SocialAccount of users
+#
+#   The memo is active within a request or a `social_account_scope()`, outside of them every
+#   lookup queries the database.
+#
+
+from contextlib import contextmanager
+
+from allauth.socialaccount.models import SocialAccount
+from asgiref.local import Local
+from django.conf import settings
+
+_memo = Local()
+
+
+@contextmanager
+def social_account_scope():
+    started = begin_social_account_scope()
+    try:
+        yield
+    finally:
+        if started:
+            end_social_account_scope()
+
+
+def begin_social_account_scope() -> bool:
+    if getattr(_memo, "accounts", None) is not None:
+        return False
+    _memo.accounts = {}
+    return True
+
+
+def end_social_account_scope() -> None:
+    _memo.accounts = None
+
+
+def forget_social_account(user_pk: int) -> None:
+    accounts = getattr(_memo, "accounts", None)
+    if accounts is not None:
+        accounts.pop(user_pk, None)
+
+
+def get_social_account(user: settings.AUTH_USER_MODEL) -> SocialAccount | None:
+    accounts = getattr(_memo, "accounts", None)
+    if accounts is not None and user.pk in accounts:
+        return accounts[user.pk]
+    # the login claims fingerprint is joined, hence an unchanged login needs this query only
+    social_account = (
+        SocialAccount.objects.filter(user=user, provider=settings.IDANDSSO_PROVIDER_ID)
+        .select_related("idandsso_claims_fingerprint")
+        .first()
+    )
+    if accounts is not None:
+        accounts[user.pk] = social_account
+    return social_account
+
+
+def get_social_account_uids(users: (settings.AUTH_USER_MODEL)) -> {int: str}:
+    """
+    Returns the keycloak user ids of the users with a social account of IDANDSSO_PROVIDER_ID
+    by user pk using at most one query.
+    """
+    user_pks = {user.pk for user in users}
+    accounts = getattr(_memo, "accounts", None)
+    uids = {}
+    if accounts is not None:
+        for user_pk in [user_pk for user_pk in user_pks if user_pk in accounts]:
+            user_pks.discard(user_pk)
+            if accounts[user_pk] is not None:
+                uids[user_pk] = accounts[user_pk].uid
+    if user_pks:
+        found = {
+            social_account.user_id: social_account
+            for social_account in SocialAccount.objects.filter(
+                user_id__in=user_pks, provider=settings.IDANDSSO_PROVIDER_ID
+            )
+        }
+        for user_pk in user_pks:
+            if accounts is not None:
+                accounts[user_pk] = found.get(user_pk)
+            if user_pk in found:
+                uids[user_pk] = found[user_pk].uid
+    return uids
+
+
+def is_social_account(user: settings.AUTH_USER_MODEL) -> bool:
+    return get_social_account(user) is not None
@@ -0,0 +1,348 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+#
+#   collect keycloak group membership changes of a transaction and sync the net changes
+#   after the commit
+#
+
+import asyncio
+import math
+import weakref
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import contextmanager
+from contextvars import copy_context
+from dataclasses import (
+    dataclass,
+    field,
+)
+
+from asgiref.local import Local
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import (
+    connections,
+    transaction,
+)
+from loguru import logger
+
+from .keycloak import (
+    aadd_user_to_keycloak_group,
+    add_user_to_keycloak_group,
+    aremove_user_from_keycloak_group,
+    remove_user_from_keycloak_group,
+)
+from .metrics import timed
+from .outbox import (
+    enqueue_sync_intents,
+    is_outbox_enabled,
+)
+from .socialaccounts import (
+    get_social_account_uids,
+    social_account_scope,
+)
+from .utils import is_asgi_request
+
+
+@dataclass
+class SyncResult:
+    """
+    (user, keycloak group name, is_add) tuples per outcome of a sync
+    """
+
+    succeeded: list = field(default_factory=list)
+    failed: list = field(default_factory=list)
+    skipped: list = field(default_factory=list)
+
+
+class SyncBuffer:
+    """
+    Collects the keycloak group membership changes of one transaction.
+
+    Only the net change per (user, group) pair is kept: duplicates are dropped and opposite
+    changes, e.g. a remove followed by an add like `user.groups.set()` does, cancel each other.
+    """
+
+    def __init__(self):
+        self.users = {}
+        self.changes = {}
+        # changes registered on commit and not added yet, a change dropped by a rolled back
+        # savepoint is garbage and leaves the set
+        self._deferred = weakref.WeakSet()
+
+    def add(self, users: (settings.AUTH_USER_MODEL), keycloak_group_names: (str), is_add: bool):
+        for user in users:
+            self.users[user.pk] = user
+            for group_name in keycloak_group_names:
+                pair = (user.pk, group_name)
+                if pair not in self.changes:
+                    self.changes[pair] = is_add
+                elif self.changes[pair] != is_add:
+                    del self.changes[pair]
+
+    def defer(
+        self, users: (settings.AUTH_USER_MODEL), keycloak_group_names: (str), is_add: bool
+    ) -> None:
+        """
+        Adds the changes on commit of the current savepoint, the buffer is flushed after the
+        last deferred change was added.
+        """
+        change = _DeferredChange(self, list(users), list(keycloak_group_names), is_add)
+        self._deferred.add(change)
+        transaction.on_commit(change)
+
+    def is_deferring(self) -> bool:
+        return bool(self._deferred)
+
+    def flush(self) -> None:
+        # later changes get a new buffer, e.g. in on-commit callbacks captured by tests
+        connection = transaction.get_connection()
+        if getattr(connection, "idandsso_sync_buffer", None) is self:
+            connection.idandsso_sync_buffer = None
+        with social_account_scope():
+            self._flush()
+
+    def _flush(self) -> None:
+        changes, self.changes = self.changes, {}
+        if not changes:
+            return
+        sync_changes(
+            [
+                (self.users[user_pk], group_name, is_add)
+                for (user_pk, group_name), is_add in changes.items()
+            ]
+        )
+
+
+class _DeferredChange:
+    """
+    On-commit callback adding a change to its buffer and flushing it after the last one.
+    """
+
+    def __init__(self, buffer: SyncBuffer, users: list, keycloak_group_names: list, is_add: bool):
+        self.buffer = buffer
+        self.users = users
+        self.keycloak_group_names = keycloak_group_names
+        self.is_add = is_add
+
+    def __call__(self) -> None:
+        self.buffer._deferred.discard(self)
+        self.buffer.add(self.users, self.keycloak_group_names, self.is_add)
+        if not self.buffer.is_deferring():
+            self.buffer.flush()
+
+
+_origin = Local()
+
+
+@contextmanager
+def changes_from_keycloak():
+    """
+    Membership changes made within this context come from keycloak, e.g. during login, and
+    are not synced back.
+    """
+    previous = getattr(_origin, "keycloak", False)
+    _origin.keycloak = True
+    try:
+        yield
+    finally:
+        _origin.keycloak = previous
+
+
+def is_change_from_keycloak() -> bool:
+    return getattr(_origin, "keycloak", False)
+
+
+def schedule_sync(
+    users: (settings.AUTH_USER_MODEL), keycloak_group_names: (str), is_add: bool
+) -> None:
+    """
+    Adds the changes to the sync buffer of the current transaction, which is flushed once
+    after a successful commit. Changes of rolled back savepoints are not synced. Without a
+    transaction, the changes are synced immediately.
+
+    If `IDANDSSO_SYNC_OUTBOX` is enabled, the changes are stored in the outbox instead, within
+    the transaction making them.
+    """
+    if not keycloak_group_names or is_change_from_keycloak():
+        return
+    if is_outbox_enabled():
+        enqueue_sync_intents(users, keycloak_group_names, is_add)
+        return
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        buffer = SyncBuffer()
+        buffer.add(users, keycloak_group_names, is_add)
+        buffer.flush()
+        return
+
+    buffer = getattr(connection, "idandsso_sync_buffer", None)
+    if buffer is None or not buffer.is_deferring():
+        # no buffer yet, or all changes of the previous one were rolled back
+        buffer = SyncBuffer()
+        connection.idandsso_sync_buffer = buffer
+    buffer.defer(users, keycloak_group_names, is_add)
+
+
+def _process_sync(
+    users: (settings.AUTH_USER_MODEL), keycloak_group_names: (str), is_add: bool
+) -> SyncResult:
+    return sync_changes(
+        [(user, group_name, is_add) for user in users for group_name in keycloak_group_names]
+    )
+
+
+def sync_changes(changes: [(settings.AUTH_USER_MODEL, str, bool)]) -> SyncResult:
+    """
+    Syncs the (user, keycloak group name, is_add) changes with keycloak right away, e.g. for
+    management commands, while changes of the group memberships are synced on commit.
+
+    With `IDANDSSO_SYNC_MAX_WORKERS` > 1, the calls are made in a thread pool of that size and
+    awaited until one deadline, `IDANDSSO_SYNC_CALL_TIMEOUT` seconds per round of the pool.
+    Calls still pending then are failed.
+    """
+    with timed("sync") as observation:
+        result = _sync_social_changes(changes)
+        if result.failed:
+            observation.outcome = "error"
+    return result
+
+
+def _sync_social_changes(changes: [(settings.AUTH_USER_MODEL, str, bool)]) -> SyncResult:
+    result = SyncResult()
+    kc_user_ids = get_social_account_uids({user for user, *_ in changes})
+    result.skipped = [change for change in changes if change[0].pk not in kc_user_ids]
+    changes = [
+        (*change, kc_user_ids[change[0].pk]) for change in changes if change[0].pk in kc_user_ids
+    ]
+    logger.debug(f"Syncing {len(changes)} group membership changes with keycloak")
+
+    max_workers = getattr(settings, "IDANDSSO_SYNC_MAX_WORKERS", 1)
+    if changes and getattr(settings, "IDANDSSO_SYNC_ASYNC", True) and is_asgi_request():
+        # served by ASGI, the calls are run concurrently on its event loop instead of threads,
+        # while this thread waits for them
+        for change, error in async_to_sync(_async_sync_changes)(changes, max_workers):
+            if error is None:
+                result.succeeded.append(change)
+            else:
+                logger.error(f"Error while syncing groups with keycloak: {error!r}")
+                result.failed.append(change)
+    elif max_workers <= 1 or len(changes) <= 1:
+        for change in changes:
+            _collect_result(result, change[:3], _sync_change, change)
+    else:
+        call_timeout = getattr(settings, "IDANDSSO_SYNC_CALL_TIMEOUT", None)
+        workers = min(max_workers, len(changes))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="idandsso-sync")
+        try:
+            futures = {
+                # the context is copied, so the calls are attributed to the current request
+                executor.submit(copy_context().run, _sync_change_in_thread, change): change[:3]
+                for change in changes
+            }
+            # one deadline for all calls, which gives each round of the pool the call timeout
+            timeout = (
+                None if call_timeout is None else call_timeout * math.ceil(len(changes) / workers)
+            )
+            done, _ = wait(futures, timeout=timeout)
+            for future, change in futures.items():
+                if future in done:
+                    _collect_result(result, change, future.result)
+                else:
+                    # still running calls end with the timeout of the keycloak client
+                    logger.error(f"Timeout while syncing groups with keycloak: {change}")
+                    result.failed.append(change)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    logger.debug(
+        f"Synced group memberships with keycloak: {len(result.succeeded)} succeeded, "
+        f"{len(result.failed)} failed, {len(result.skipped)} skipped"
+    )
+    return result
+
+
+def _collect_result(result: SyncResult, change, call, *args) -> None:
+    try:
+        call(*args)
+        result.succeeded.append(change)
+    except Exception as e:
+        logger.error(f"Error while syncing groups with keycloak: {e}")
+        result.failed.append(change)
+
+
+def _sync_change(change: (settings.AUTH_USER_MODEL, str, bool, str)) -> None:
+    user, group_name, is_add, kc_user_id = change
+    if is_add:
+        with timed("keycloak_group_user_add"):
+            add_user_to_keycloak_group(user, group_name, kc_user_id=kc_user_id)
+    else:
+        with timed("keycloak_group_user_remove"):
+            remove_user_from_keycloak_group(user, group_name, kc_user_id=kc_user_id)
+
+
+async def _async_sync_changes(changes: [(settings.AUTH_USER_MODEL, str, bool, str)], limit: int):
+    semaphore = asyncio.Semaphore(max(limit, 1))
+    call_timeout = getattr(settings, "IDANDSSO_SYNC_CALL_TIMEOUT", None)
+
+    async def sync_change(change):
+        user, group_name, is_add, kc_user_id = change
+        async with semaphore:
+            try:
+                if is_add:
+                    with timed("keycloak_group_user_add"):
+                        await asyncio.wait_for(
+                            aadd_user_to_keycloak_group(user, group_name, kc_user_id=kc_user_id),
+                            call_timeout,
+                        )
+                else:
+                    with timed("keycloak_group_user_remove"):
+                        await asyncio.wait_for(
+                            aremove_user_from_keycloak_group(
+                                user, group_name, kc_user_id=kc_user_id
+                            ),
+                            call_timeout,
+                        )
+            except Exception as e:
+                return change[:3], e
+        return change[:3], None
+
+    return await asyncio.gather(*[sync_change(change) for change in changes])
+
+
+def _sync_change_in_thread(change: (settings.AUTH_USER_MODEL, str, bool, str)) -> None:
+    try:
+        _sync_change(change)
+    finally:
+        # database connections are per thread and would be leaked otherwise
+        connections.close_all()
@@ -31,9 +31,20 @@
 from django import template
 from django.conf import settings
 
+from idandsso.utils import is_silent_sso_candidate
+
 register = template.Library()
 
 
 @register.simple_tag
 def idandsso_provider_id():
     return getattr(settings, "IDANDSSO_PROVIDER_ID", "zalf-idp")
+
+
+@register.simple_tag(takes_context=True)
+def idandsso_silent_sso(context):
+    """
+    Usage: {% idandsso_silent_sso as silent_sso %}
+    """
+    request = context.get("request")
+    return request is not None and is_silent_sso_candidate(request)
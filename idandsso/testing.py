@@ -0,0 +1,410 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+#
+#   in-process stand-ins for keycloak, used by benchmarks and tests of projects using idandsso
+#
+
+import base64
+import json
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from copy import deepcopy
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from urllib.parse import (
+    parse_qs,
+    urlparse,
+)
+
+from django.conf import settings
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    connections,
+)
+
+_ADMIN_PATH = re.compile(r"^/admin/realms/(?P<realm>[^/]+)/(?P<resource>.*)$")
+
+
+class FakeKeycloak:
+    """
+    Serves the parts of the keycloak admin REST API and the OIDC token endpoint used by
+    idandsso on a local port, with an optional latency per request.
+
+        with FakeKeycloak(latency=0.01) as kc, override_settings(**kc.settings()):
+            reset_idandsso_state()
+            ...
+
+    All requests are recorded as (method, route) in `requests`, e.g.
+    ("PUT", "users/{id}/groups/{id}"). Group membership changes are recorded as keycloak
+    admin events in `admin_events`, e.g. to be posted to the `keycloak_events` webhook.
+    """
+
+    def __init__(self, realm: str = "idandsso", latency: float = 0.0, token_lifetime: int = 300):
+        self.realm = realm
+        self.latency = latency
+        self.token_lifetime = token_lifetime
+        self.groups = {}
+        self.users = {}
+        self.members = {}
+        self.requests = []
+        self.admin_events = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    def add_group(self, name: str) -> str:
+        group_id = str(uuid.uuid4())
+        with self._lock:
+            self.groups[group_id] = {"id": group_id, "name": name, "path": f"/{name}"}
+            self.members[group_id] = set()
+        return group_id
+
+    def add_user(self, username: str, **representation) -> str:
+        user_id = str(uuid.uuid4())
+        with self._lock:
+            self.users[user_id] = {"id": user_id, "username": username, **representation}
+        return user_id
+
+    def add_member(self, group_name: str, user_id: str) -> None:
+        with self._lock:
+            self._change_membership(user_id, self.group_id(group_name), is_add=True)
+
+    def remove_member(self, group_name: str, user_id: str) -> None:
+        with self._lock:
+            self._change_membership(user_id, self.group_id(group_name), is_add=False)
+
+    def pop_admin_events(self) -> [dict]:
+        with self._lock:
+            admin_events, self.admin_events = self.admin_events, []
+            return admin_events
+
+    def group_id(self, group_name: str) -> str:
+        return next(group["id"] for group in self.groups.values() if group["name"] == group_name)
+
+    def group_member_ids(self, group_name: str) -> {str}:
+        with self._lock:
+            return set(self.members[self.group_id(group_name)])
+
+    def count(self, method: str | None = None, route: str | None = None) -> int:
+        with self._lock:
+            return sum(
+                1
+                for request in self.requests
+                if (method is None or request[0] == method)
+                and (route is None or request[1] == route)
+            )
+
+    def reset_requests(self) -> None:
+        with self._lock:
+            self.requests.clear()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/"
+
+    def settings(self) -> dict:
+        """
+        Settings pointing idandsso to this instance, to be used with `override_settings`.
+        """
+        root = f"{self.url}realms/{self.realm}/"
+        providers = deepcopy(getattr(settings, "SOCIALACCOUNT_PROVIDERS", {}))
+        apps = providers.setdefault("openid_connect", {}).setdefault("APPS", [{}])
+        apps[0].setdefault("client_id", "idandsso")
+        apps[0].setdefault("secret", "secret")
+        apps[0].setdefault("settings", {}).update(
+            server_url=f"{root}.well-known/openid-configuration",
+            oidc_endpoint=f"{root}protocol/openid-connect/",
+        )
+        return {
+            "IDANDSSO_PROVIDER_HOST": self.url,
+            "IDANDSSO_PROVIDER_REALM": self.realm,
+            "IDANDSSO_PROVIDER_ROOT": root,
+            "SOCIALACCOUNT_PROVIDERS": providers,
+        }
+
+    def start(self) -> "FakeKeycloak":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def handle(self, method: str, path: str, query: dict, body: bytes) -> (int, object):
+        if self.latency:
+            time.sleep(self.latency)
+        if method == "GET" and path == "/":
+            self._record(method, "/")
+            return 200, {}
+        if method == "POST" and path == f"/realms/{self.realm}/protocol/openid-connect/token":
+            self._record(method, "token")
+            return 200, self._token()
+        match = _ADMIN_PATH.match(path)
+        if not match or match["realm"] != self.realm:
+            return 404, {"error": "not found"}
+        parts = match["resource"].strip("/").split("/")
+        route = "/".join(part if i % 2 == 0 else "{id}" for i, part in enumerate(parts))
+        self._record(method, route)
+        with self._lock:
+            return self._admin(method, parts, query)
+
+    def _admin(self, method: str, parts: [str], query: dict) -> (int, object):
+        first = int(query.get("first", 0))
+        maximum = int(query.get("max", 100))
+        if method == "GET" and parts == ["groups"]:
+            search = query.get("search")
+            groups = [
+                dict(group)
+                for group in self.groups.values()
+                if not search or search.lower() in group["name"].lower()
+            ]
+            return 200, groups[first : first + maximum]
+        if method == "GET" and len(parts) == 3 and parts[0] == "groups" and parts[2] == "members":
+            if parts[1] not in self.members:
+                return 404, {"error": "Could not find group by id"}
+            member_ids = sorted(self.members[parts[1]])[first : first + maximum]
+            return 200, [self.users[user_id] for user_id in member_ids]
+        if method == "GET" and parts == ["users"]:
+            return 200, list(self.users.values())[first : first + maximum]
+        if method == "GET" and parts == ["users", "count"]:
+            return 200, len(self.users)
+        if len(parts) == 4 and parts[0] == "users" and parts[2] == "groups":
+            user_id, group_id = parts[1], parts[3]
+            if user_id not in self.users or group_id not in self.members:
+                return 404, {"error": "not found"}
+            if method in ["PUT", "DELETE"]:
+                self._change_membership(user_id, group_id, is_add=method == "PUT")
+                return 204, None
+        return 404, {"error": "not found"}
+
+    def _token(self) -> dict:
+        expires_at = int(time.time()) + self.token_lifetime
+        payload = base64.urlsafe_b64encode(json.dumps({"exp": expires_at}).encode())
+        id_token = f"e30.{payload.decode().rstrip('=')}.fake"
+        return {
+            "access_token": id_token,
+            "id_token": id_token,
+            "expires_in": self.token_lifetime,
+            "token_type": "Bearer",
+        }
+
+    def _change_membership(self, user_id: str, group_id: str, is_add: bool) -> None:
+        if is_add:
+            self.members[group_id].add(user_id)
+        else:
+            self.members[group_id].discard(user_id)
+        self.admin_events.append(
+            {
+                "id": str(uuid.uuid4()),
+                "time": int(time.time() * 1000),
+                "realmId": self.realm,
+                "operationType": "CREATE" if is_add else "DELETE",
+                "resourceType": "GROUP_MEMBERSHIP",
+                "resourcePath": f"users/{user_id}/groups/{group_id}",
+                "representation": json.dumps(self.groups[group_id]),
+            }
+        )
+
+    def _record(self, method: str, route: str) -> None:
+        with self._lock:
+            self.requests.append((method, route))
+
+
+def _handler(fake: FakeKeycloak):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _respond(self):
+            url = urlparse(self.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            status, payload = fake.handle(self.command, url.path, query, body)
+            content = b"" if payload is None else json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def reset_idandsso_state() -> None:
+    """
+    Drops all process-wide clients and caches of idandsso, e.g. after changing its settings.
+    """
+    from . import adapter
+    from .groupindex import invalidate_group_index
+    from .groupmap import reset_group_mapping
+    from .keycloak import (
+        _admin_manager,
+        _circuit_breaker,
+        clear_keycloak_group_id_cache,
+    )
+    from .metrics import reset_metrics
+    from .utils import sso_cookie_domain
+
+    _admin_manager.reset()
+    _circuit_breaker.reset()
+    adapter._reset()
+    clear_keycloak_group_id_cache()
+    reset_group_mapping()
+    invalidate_group_index()
+    reset_metrics()
+    sso_cookie_domain.cache_clear()
+
+
+@contextmanager
+def isolated_environment(interactive: bool = True):
+    """
+    A new test database and a local memory cache for idandsso, like `manage.py test`, so
+    commands measuring idandsso do not touch the database and caches of the project.
+    An existing test database is only replaced after confirmation, or if not `interactive`.
+    """
+    from django.test import override_settings
+
+    connection = connections[DEFAULT_DB_ALIAS]
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=not interactive, serialize=False
+    )
+    try:
+        with override_settings(
+            CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+            IDANDSSO_GROUP_ID_CACHE_ALIAS="default",
+            IDANDSSO_GROUP_INDEX_CACHE_ALIAS="default",
+        ):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+class Costs:
+    """
+    Database queries and keycloak requests of a block, see `record_costs`.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.keycloak_requests = []
+
+    def as_dict(self) -> dict:
+        return {
+            "queries": len(self.queries),
+            "keycloak_requests": len(self.keycloak_requests),
+        }
+
+    def assert_budget(
+        self, queries: int | None = None, keycloak_requests: int | None = None
+    ) -> None:
+        """
+        Raises an AssertionError listing the queries or requests, if a given count differs.
+        """
+        for name, expected in [("queries", queries), ("keycloak_requests", keycloak_requests)]:
+            recorded = getattr(self, name)
+            if expected is not None and len(recorded) != expected:
+                details = "\n".join(f"  {entry}" for entry in recorded)
+                raise AssertionError(f"{len(recorded)} {name} instead of {expected}:\n{details}")
+
+
+@contextmanager
+def record_costs(keycloak: FakeKeycloak | None = None, using: str = DEFAULT_DB_ALIAS):
+    """
+    Records the database queries and requests to the `FakeKeycloak` of the block. Syncs
+    deferred to the commit of the current transaction are run and recorded at its end, e.g.
+
+        with record_costs(kc) as costs:
+            group.user_set.add(*users)
+        costs.assert_budget(queries=3, keycloak_requests=len(users))
+    """
+    # imported here, so importing idandsso.testing does not load the django test framework
+    from django.test import TestCase
+    from django.test.utils import CaptureQueriesContext
+
+    costs = Costs()
+    start = len(keycloak.requests) if keycloak else 0
+    with (
+        CaptureQueriesContext(connections[using]) as context,
+        TestCase.captureOnCommitCallbacks(using=using, execute=True),
+    ):
+        yield costs
+    costs.queries = [query["sql"] for query in context.captured_queries]
+    if keycloak:
+        costs.keycloak_requests = keycloak.requests[start:]
+
+
+# terms of the cost per order of growth in the number of users N and groups M
+_GROWTH_TERMS = {
+    "O(1)": set(),
+    "O(N)": {"N"},
+    "O(M)": {"M"},
+    "O(N+M)": {"N", "M"},
+    "O(N*M)": {"N", "M", "N*M"},
+}
+
+
+def cost_growth(costs: {(int, int): int}) -> str:
+    """
+    Order of growth of a cost measured for (N, M) = (n, m), (2n, m), (n, 2m) and (2n, 2m),
+    fitted exactly to `a + b * N + c * M + d * N * M`.
+    """
+    (n, m), *_ = sorted(costs)
+    c11, c21 = costs[(n, m)], costs[(2 * n, m)]
+    c12, c22 = costs[(n, 2 * m)], costs[(2 * n, 2 * m)]
+    if c22 - c21 - c12 + c11:
+        return "O(N*M)"
+    terms = {term for term, delta in [("N", c21 - c11), ("M", c12 - c11)] if delta}
+    return next(growth for growth, growth_terms in _GROWTH_TERMS.items() if growth_terms == terms)
+
+
+def assert_cost_growth(costs: {(int, int): int}, expected: str) -> None:
+    """
+    Raises an AssertionError if the cost grows faster than `expected`, e.g. "O(N)".
+    """
+    growth = cost_growth(costs)
+    if not _GROWTH_TERMS[growth] <= _GROWTH_TERMS[expected]:
+        raise AssertionError(f"Cost grows with {growth} instead of {expected}: {costs}")
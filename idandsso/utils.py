@@ -28,12 +28,27 @@
 #     You should have received a copy of the GNU General Public License
 #     along with this program. If not, see <https://www.gnu.org/licenses/>.
 
+import asyncio
+import re
+import time
+import weakref
+from functools import cache
 from urllib.parse import urlparse
 
+from asgiref.local import Local
 from django.conf import settings
 from loguru import logger
 
+SSO_HINT_COOKIE = "sso_hint"
+SSO_BACKOFF_COOKIE = "sso_backoff"
 
+DEFAULT_BOT_USER_AGENT_PATTERN = (
+    r"bot|crawl|spider|slurp|preview|facebookexternalhit|embedly|whatsapp|slack|discord|"
+    r"telegram|skype|headless|lighthouse|curl|wget|python-requests|httpx|go-http-client"
+)
+
+
+@cache
 def sso_cookie_domain():
     """
     django.conf.settings.SITE_URL and .SITEURL are not standardized, hence both are possible:
@@ -41,6 +56,8 @@ def sso_cookie_domain():
     https://docs.djangoproject.com/en/4.2/ref/settings/
 
     Extracts the SSO cookie domain from the site's URL, defaulting to localhost
+
+    The result is memoised and cleared, if the settings change.
     """
 
     site_url = (
@@ -51,3 +68,176 @@ def sso_cookie_domain():
     sso_cookie_domain = f".{'.'.join(urlparse(site_url).netloc.split(':')[0].split('.')[1:])}"
     logger.debug(f"Domain for cookie: '{sso_cookie_domain}'")
     return sso_cookie_domain
+
+
+def set_sso_hint_cookie(request, response) -> None:
+    """
+    Sets the sso_hint cookie. Its value `true:<issued at>` allows to refresh it only when
+    required, see `sso_hint_needs_refresh`.
+    """
+    response.set_cookie(
+        SSO_HINT_COOKIE,
+        f"true:{int(time.time())}",
+        domain=sso_cookie_domain(),
+        max_age=getattr(settings, "SESSION_COOKIE_AGE", 3600),
+        samesite="Lax",
+        path="/",
+        secure=request.is_secure(),
+        httponly=False,
+    )
+
+
+def has_sso_hint(request) -> bool:
+    return request.COOKIES.get(SSO_HINT_COOKIE, "").split(":")[0] == "true"
+
+
+def sso_hint_needs_refresh(request) -> bool:
+    """
+    True, if the sso_hint cookie is missing, has no issue time or its remaining lifetime is
+    below IDANDSSO_SSO_HINT_REFRESH_FRACTION of SESSION_COOKIE_AGE.
+    """
+    if not has_sso_hint(request):
+        return True
+    try:
+        issued_at = int(request.COOKIES[SSO_HINT_COOKIE].split(":")[1])
+    except (IndexError, ValueError):
+        return True
+    max_age = getattr(settings, "SESSION_COOKIE_AGE", 3600)
+    refresh_fraction = getattr(settings, "IDANDSSO_SSO_HINT_REFRESH_FRACTION", 0.5)
+    return issued_at + max_age - time.time() <= max_age * refresh_fraction
+
+
+def sso_backoff_until(request) -> int:
+    """
+    Time until the silent SSO is not attempted, after the last attempt failed.
+    """
+    try:
+        return int(request.COOKIES.get(SSO_BACKOFF_COOKIE, "").split(":")[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+def set_sso_backoff_cookie(request, response) -> None:
+    """
+    Records a failed silent SSO, e.g. `login_required`, in the sso_backoff cookie
+    `<failures>:<until>`. The backoff doubles with each failure, starting with
+    IDANDSSO_SSO_BACKOFF seconds up to IDANDSSO_SSO_BACKOFF_MAX seconds.
+    """
+    try:
+        failures = int(request.COOKIES.get(SSO_BACKOFF_COOKIE, "").split(":")[0]) + 1
+    except ValueError:
+        failures = 1
+    backoff = getattr(settings, "IDANDSSO_SSO_BACKOFF", 60)
+    backoff_max = getattr(settings, "IDANDSSO_SSO_BACKOFF_MAX", 86400)
+    delay = min(backoff * 2 ** min(failures - 1, 32), backoff_max)
+    logger.debug(f"Silent SSO failed {failures} times, backing off for {delay}s")
+    response.set_cookie(
+        SSO_BACKOFF_COOKIE,
+        f"{failures}:{int(time.time() + delay)}",
+        domain=sso_cookie_domain(),
+        # outlives the backoff, so the number of failures is kept
+        max_age=backoff_max * 2,
+        samesite="Lax",
+        path="/",
+        secure=request.is_secure(),
+        httponly=False,
+    )
+
+
+def delete_sso_backoff_cookie(request, response) -> None:
+    if SSO_BACKOFF_COOKIE in request.COOKIES:
+        response.delete_cookie(SSO_BACKOFF_COOKIE, domain=sso_cookie_domain(), path="/")
+
+
+# request headers deciding about the silent SSO, hence varying the rendered page
+SILENT_SSO_VARY_HEADERS = [
+    "Cookie",
+    "User-Agent",
+    "Sec-Fetch-Mode",
+    "Sec-Fetch-Dest",
+    "Sec-Purpose",
+    "Purpose",
+    "X-Requested-With",
+]
+
+
+def is_silent_sso_candidate(request) -> bool:
+    """
+    True, if an anonymous page view may attempt the silent SSO: a top-level navigation
+    of a browser, which is neither a bot nor backing off after failed attempts.
+
+    The request is marked, so KeycloakSilentSSOMiddleware adds SILENT_SSO_VARY_HEADERS to
+    the `Vary` header of the response, and caches do not serve the decision to other clients.
+    """
+    request.idandsso_silent_sso_decided = True
+    if request.method != "GET" or not has_sso_hint(request):
+        return False
+    if sso_backoff_until(request) > time.time():
+        return False
+    headers = request.headers
+    if headers.get("Sec-Fetch-Mode", "navigate") != "navigate":
+        return False
+    if headers.get("Sec-Fetch-Dest", "document") != "document":
+        return False
+    if "prefetch" in headers.get("Sec-Purpose", headers.get("Purpose", "")):
+        return False
+    if headers.get("X-Requested-With") == "XMLHttpRequest":
+        return False
+    user_agent = headers.get("User-Agent", "")
+    return bool(user_agent) and not bot_user_agent_pattern().search(user_agent)
+
+
+@cache
+def bot_user_agent_pattern() -> re.Pattern:
+    """
+    IDANDSSO_SSO_BOT_USER_AGENT_PATTERN compiled, memoised and cleared, if the settings change.
+    """
+    return re.compile(
+        getattr(settings, "IDANDSSO_SSO_BOT_USER_AGENT_PATTERN", DEFAULT_BOT_USER_AGENT_PATTERN),
+        re.IGNORECASE,
+    )
+
+
+# whether the current request is served by ASGI, set by the request_started signal
+_request = Local()
+
+
+def begin_request(is_asgi: bool) -> None:
+    _request.is_asgi = is_asgi
+
+
+def end_request() -> None:
+    _request.is_asgi = False
+
+
+def is_asgi_request() -> bool:
+    """
+    Whether this sync code serves a request of an ASGI server in a thread of `sync_to_async`,
+    hence `async_to_sync` runs coroutines on the server's event loop.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return getattr(_request, "is_asgi", False)
+    # called by async code, which must not block the loop
+    return False
+
+
+class LoopLocal:
+    """
+    One value per event loop, e.g. an async HTTP client, which must not be shared between loops.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._values = weakref.WeakKeyDictionary()
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        value = self._values.get(loop)
+        if value is None:
+            value = self._values[loop] = self._factory()
+        return value
+
+    def clear(self) -> None:
+        self._values = weakref.WeakKeyDictionary()
@@ -0,0 +1,118 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import hmac
+import json
+
+from django.conf import settings
+from django.http import (
+    Http404,
+    HttpResponse,
+    JsonResponse,
+)
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import (
+    require_GET,
+    require_POST,
+)
+from loguru import logger
+
+from .events import apply_admin_events
+from .health import idp_status
+from .keycloak import keycloak_circuit_state
+from .metrics import metrics as metrics_backend
+
+
+@never_cache
+@require_GET
+def idp_health(request):
+    """
+    Readiness of the IDP as last probed, does not request the IDP itself.
+    """
+    status = idp_status()
+    return JsonResponse(
+        {
+            "status": "ok" if status["available"] else "unavailable",
+            "latency_ms": round(status["latency"] * 1000) if status["latency"] else None,
+            "checked_at": status["checked_at"],
+            "error": status["error"],
+            "keycloak_circuit": keycloak_circuit_state()["state"],
+        },
+        status=200 if status["available"] else 503,
+    )
+
+
+@never_cache
+@require_GET
+def metrics(request):
+    """
+    Metrics in the Prometheus text format, if IDANDSSO_METRICS_BACKEND renders them.
+    """
+    backend = metrics_backend()
+    if not hasattr(backend, "render"):
+        raise Http404()
+    return HttpResponse(backend.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@csrf_exempt
+@never_cache
+@require_POST
+def keycloak_events(request):
+    """
+    Applies a batch of keycloak admin events, authenticated by IDANDSSO_WEBHOOK_SECRET
+    either as bearer token or as HMAC-SHA256 of the body in the X-Keycloak-Signature header.
+    """
+    secret = getattr(settings, "IDANDSSO_WEBHOOK_SECRET", None)
+    if not secret:
+        raise Http404()
+    if not _is_authenticated_webhook(request, secret):
+        logger.warning("Rejected keycloak admin events with invalid credentials")
+        return JsonResponse({"error": "unauthorized"}, status=401)
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"error": "invalid json"}, status=400)
+    if isinstance(payload, dict):
+        payload = payload.get("events", [payload])
+    if not isinstance(payload, list) or not all(isinstance(event, dict) for event in payload):
+        return JsonResponse({"error": "expected a list of events"}, status=400)
+    return JsonResponse(apply_admin_events(payload))
+
+
+def _is_authenticated_webhook(request, secret: str) -> bool:
+    authorization = request.headers.get("Authorization", "")
+    if authorization.startswith("Bearer "):
+        # compared as bytes, as compare_digest rejects non-ASCII strings with a TypeError
+        return hmac.compare_digest(authorization[len("Bearer ") :].encode(), secret.encode())
+    signature = request.headers.get("X-Keycloak-Signature", "")
+    expected = hmac.new(secret.encode(), request.body, hashlib.sha256).hexdigest()
+    return bool(signature) and hmac.compare_digest(signature.lower().encode(), expected.encode())
@@ -0,0 +1,108 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+from allauth.socialaccount.models import SocialAccount
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.test import (
+    RequestFactory,
+    override_settings,
+)
+
+from idandsso.signals import handle_user_logged_in
+from idandsso.socialaccounts import social_account_scope
+from idandsso.testing import (
+    FakeKeycloak,
+    reset_idandsso_state,
+)
+
+
+@pytest.fixture
+def kc():
+    """
+    A FakeKeycloak with the mapped, staff and superuser groups, used by idandsso.
+    """
+    with FakeKeycloak() as kc, override_settings(**kc.settings()):
+        for group_name in [
+            *settings.IDANDSSO_GROUP_MAP,
+            settings.IDANDSSO_GROUP_NAME_DJANGO_STAFF,
+            settings.IDANDSSO_GROUP_NAME_DJANGO_SUPERUSER,
+        ]:
+            kc.add_group(group_name)
+        reset_idandsso_state()
+        yield kc
+    reset_idandsso_state()
+
+
+@pytest.fixture
+def groups(db):
+    """
+    The django groups mapped by IDANDSSO_GROUP_MAP by name.
+    """
+    return {name: Group.objects.create(name=name) for name in settings.IDANDSSO_GROUP_MAP.values()}
+
+
+@pytest.fixture
+def make_user(db, kc):
+    """
+    Creates users with a social account of a user of the FakeKeycloak.
+    """
+
+    def make_user(username: str, kc_groups: [str] = ()):
+        user = get_user_model().objects.create(username=username)
+        SocialAccount.objects.create(
+            user=user,
+            provider=settings.IDANDSSO_PROVIDER_ID,
+            uid=kc.add_user(username),
+            extra_data={"id_token": {"groups": list(kc_groups)}, "userinfo": {}},
+        )
+        return user
+
+    return make_user
+
+
+@pytest.fixture
+def login():
+    """
+    Logs the user in with the given IDP groups, like the user_logged_in signal of allauth.
+    """
+
+    def login(user, kc_groups: [str]):
+        social_account = SocialAccount.objects.get(user=user)
+        social_account.extra_data = {"id_token": {"groups": list(kc_groups)}, "userinfo": {}}
+        social_account.save(update_fields=["extra_data"])
+        request = RequestFactory().get("/")
+        request.user = user
+        with social_account_scope():
+            handle_user_logged_in(None, request, None, user)
+
+    return login
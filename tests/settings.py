@@ -0,0 +1,104 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+#
+#   settings of the django project running the tests
+#
+
+SECRET_KEY = "idandsso-tests"
+INSTALLED_APPS = [
+    "django.contrib.auth",
+    "django.contrib.contenttypes",
+    "django.contrib.sessions",
+    "django.contrib.messages",
+    "django.contrib.sites",
+    "allauth",
+    "allauth.account",
+    "allauth.socialaccount",
+    "allauth.socialaccount.providers.openid_connect",
+    "idandsso",
+]
+SITE_ID = 1
+DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}}
+CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+MIDDLEWARE = [
+    "django.contrib.sessions.middleware.SessionMiddleware",
+    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "idandsso.middleware.KeycloakSilentSSOMiddleware",
+    "allauth.account.middleware.AccountMiddleware",
+]
+ROOT_URLCONF = "tests.urls"
+TEMPLATES = [
+    {
+        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "APP_DIRS": True,
+        "OPTIONS": {},
+    }
+]
+USE_TZ = True
+LOGIN_URL = "/login"
+LOGIN_REDIRECT_URL = "/"
+ACCOUNT_ADAPTER = "idandsso.adapter.KeycloakOrcidAccountAdapter"
+ACCOUNT_EMAIL_VERIFICATION = "none"
+SOCIALACCOUNT_ENABLED = True
+SOCIALACCOUNT_EMAIL_REQUIRED = True
+SITE_URL = "http://localhost/"
+SOCIALACCOUNT_LOGOUT_REDIRECT_URL = "/"
+SOCIALACCOUNT_PROVIDERS = {
+    "openid_connect": {
+        "APPS": [
+            {
+                "provider_id": "idandsso",
+                "name": "idandsso",
+                "client_id": "idandsso",
+                "secret": "secret",
+                "settings": {},
+            }
+        ]
+    }
+}
+GEONODE_API_TIMEOUT = 1
+
+# the FakeKeycloak fixture points the provider settings to its local port
+IDANDSSO_IDP_PROBE = "off"
+IDANDSSO_CLIENT_ID = "idandsso"
+IDANDSSO_CLIENT_SECRET = "secret"
+IDANDSSO_CONNECTOR_NAME = "idandsso"
+IDANDSSO_PROVIDER_ID = "idandsso"
+IDANDSSO_PROVIDER_HOST = "http://127.0.0.1:9/"
+IDANDSSO_PROVIDER_REALM = "idandsso"
+IDANDSSO_PROVIDER_ROOT = "http://127.0.0.1:9/realms/idandsso/"
+IDANDSSO_GROUP_MAP = {
+    "kc_users": "users",
+    "kc_admin": "admin",
+}
+IDANDSSO_GROUP_NAME_DJANGO_STAFF = "kc_staff"
+IDANDSSO_GROUP_NAME_DJANGO_SUPERUSER = "kc_superuser"
+IDANDSSO_SYNC_OUTBOX = False
@@ -0,0 +1,118 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import base64
+import json
+import time
+from urllib.parse import (
+    parse_qs,
+    urlparse,
+)
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+
+from idandsso import adapter
+from idandsso.adapter import (
+    KeycloakOrcidAccountAdapter,
+    _cache_id_token,
+    _cached_id_token,
+)
+
+ENDPOINT = "http://idp.test/realms/idandsso/protocol/openid-connect/"
+
+
+@pytest.fixture(autouse=True)
+def reset_id_tokens():
+    adapter._reset()
+    yield
+    adapter._reset()
+
+
+def test_id_token_expires_with_its_exp_claim():
+    _cache_id_token(ENDPOINT, _id_token({"exp": 1234}), {"expires_in": 60})
+    assert adapter._id_tokens[ENDPOINT][1] == 1234
+
+
+@pytest.mark.parametrize("id_token", ["not-a-jwt", "e30.e30.sig", "e30.!!.sig"])
+def test_id_token_without_exp_expires_with_expires_in(id_token):
+    before = time.time()
+    _cache_id_token(ENDPOINT, id_token, {"expires_in": 60})
+    assert before + 60 <= adapter._id_tokens[ENDPOINT][1] <= time.time() + 60
+
+
+def test_id_token_is_refreshed_within_the_margin(settings):
+    settings.IDANDSSO_KEYCLOAK_TOKEN_REFRESH_MARGIN = 30
+    adapter._id_tokens[ENDPOINT] = ("valid", time.time() + 40, 300)
+    assert _cached_id_token(ENDPOINT) == "valid"
+    adapter._id_tokens[ENDPOINT] = ("expiring", time.time() + 20, 300)
+    assert _cached_id_token(ENDPOINT) is None
+
+
+def test_short_lived_id_token_is_reused(settings):
+    settings.IDANDSSO_KEYCLOAK_TOKEN_REFRESH_MARGIN = 30
+    _cache_id_token(ENDPOINT, "short", {"expires_in": 10})
+    assert _cached_id_token(ENDPOINT) == "short"
+
+
+def test_logout_reuses_the_id_token(kc):
+    kc.reset_requests()
+    hints = [parse_qs(urlparse(_logout_url()).query)["id_token_hint"] for _ in range(3)]
+    assert hints[0] == hints[1] == hints[2]
+    assert kc.count("POST", "token") == 1
+
+
+def test_logout_requests_tokens_with_the_pooled_session(kc, monkeypatch):
+    session = adapter._http_session()
+    posts = []
+    post = session.post
+
+    def spy(*args, **kwargs):
+        posts.append(args[0])
+        return post(*args, **kwargs)
+
+    monkeypatch.setattr(session, "post", spy)
+    for _ in range(2):
+        adapter._id_tokens.clear()
+        _logout_url()
+    assert len(posts) == 2
+    assert adapter._http_session() is session
+
+
+def _id_token(claims: dict) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+    return f"e30.{payload}.sig"
+
+
+def _logout_url() -> str:
+    request = RequestFactory().post("/accounts/logout/", {"range": "idp-only"})
+    request.user = AnonymousUser()
+    return KeycloakOrcidAccountAdapter(request).get_logout_redirect_url(request)
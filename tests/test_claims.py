@@ -0,0 +1,138 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from types import SimpleNamespace
+
+import pytest
+from allauth.socialaccount.models import SocialAccount
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save
+from django.test import RequestFactory
+
+from idandsso.claims import (
+    DEFAULT_CLAIMS_MAP,
+    KEEP,
+    ClaimsProjection,
+    is_staff,
+    organization_name,
+    ror_link,
+)
+from idandsso.signals import handle_user_logged_in
+from idandsso.socialaccounts import social_account_scope
+
+ROR = {
+    "name": "University",
+    "disambiguated-organization": {
+        "disambiguation-source": "ROR",
+        "disambiguated-organization-identifier": "https://ror.org/00example",
+    },
+}
+
+
+def test_ror_link_of_a_ror_affiliation():
+    assert ror_link(ROR) == "https://ror.org/00example"
+
+
+def test_ror_link_of_other_sources_is_cleared():
+    organization = {**ROR, "disambiguated-organization": {"disambiguation-source": "GRID"}}
+    assert ror_link(organization) is None
+    assert ror_link({"name": "University"}) is None
+
+
+def test_ror_link_and_organization_without_name_are_kept():
+    assert ror_link(None) is KEEP
+    assert ror_link({"disambiguated-organization": ROR["disambiguated-organization"]}) is KEEP
+    assert organization_name({}) is KEEP
+
+
+def test_affiliation_is_projected():
+    user = SimpleNamespace(
+        username="alice", is_staff=False, is_superuser=False, organization="", rorlink=None
+    )
+    extra_data = {"userinfo": {"affiliation": {"organization": ROR}}}
+    changed = ClaimsProjection(DEFAULT_CLAIMS_MAP).project(user, extra_data)
+    assert set(changed) == {"organization", "rorlink"}
+    assert (user.organization, user.rorlink) == ("University", "https://ror.org/00example")
+
+
+def test_keep_leaves_existing_values_untouched():
+    user = SimpleNamespace(username="alice", organization="Old", rorlink="https://ror.org/old")
+    projection = ClaimsProjection(
+        {key: DEFAULT_CLAIMS_MAP[key] for key in ["organization", "rorlink"]}
+    )
+    assert projection.project(user, {"userinfo": {}}) == []
+    assert (user.organization, user.rorlink) == ("Old", "https://ror.org/old")
+
+
+@pytest.mark.parametrize(
+    "extra_data", [{}, {"userinfo": None}, {"userinfo": "text"}, {"userinfo": {"other": 1}}]
+)
+def test_unknown_claims_leave_fields_untouched(extra_data):
+    user = SimpleNamespace(username="alice", first_name="Alice")
+    assert ClaimsProjection({"first_name": "userinfo.given_name"}).project(user, extra_data) == []
+    assert user.first_name == "Alice"
+
+
+def test_transforms_are_imported_by_dotted_path():
+    user = SimpleNamespace(username="alice", is_staff=False)
+    projection = ClaimsProjection({"is_staff": ("id_token.groups", "idandsso.claims.is_staff")})
+    assert projection.project(user, {"id_token": {"groups": ["kc_staff"]}}) == ["is_staff"]
+    assert user.is_staff
+
+
+def test_login_saves_the_changed_fields_once(settings, kc, make_user):
+    settings.IDANDSSO_CLAIMS_MAP = {
+        "first_name": "userinfo.given_name",
+        "last_name": "userinfo.family_name",
+        "is_staff": ("id_token.groups", is_staff),
+    }
+    user = make_user("alice")
+    get_user_model().objects.filter(pk=user.pk).update(last_name="Liddell")
+    user.refresh_from_db()
+    SocialAccount.objects.filter(user=user).update(
+        extra_data={
+            "id_token": {"groups": ["kc_staff"]},
+            "userinfo": {"given_name": "Alice", "family_name": "Liddell"},
+        }
+    )
+    saves = []
+
+    def receiver(sender, update_fields, **kwargs):
+        saves.append(set(update_fields or ()))
+
+    post_save.connect(receiver, sender=get_user_model())
+    try:
+        request = RequestFactory().get("/")
+        request.user = user
+        with social_account_scope():
+            handle_user_logged_in(None, request, None, user)
+    finally:
+        post_save.disconnect(receiver, sender=get_user_model())
+    assert saves == [{"first_name", "is_staff"}]
@@ -0,0 +1,70 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+
+from idandsso.management.commands.idandsso_cost_check import (
+    EXPECTED_GROWTH,
+    check_cost_growth,
+    measure_costs,
+)
+
+# N users and M mapped groups
+SIZES = [(2, 2), (4, 2), (2, 4), (4, 4)]
+
+# (queries, keycloak requests) of N users and M mapped groups
+BUDGETS = {
+    "login_unchanged": lambda n, m: (1, 0),
+    "login_changed": lambda n, m: (6, 0),
+    "user_save": lambda n, m: (3, 1),
+    "user_groups_add": lambda n, m: (3, m),
+    "group_add": lambda n, m: (4, n),
+    "group_remove": lambda n, m: (3, n),
+    "group_clear": lambda n, m: (4, n),
+    "logout": lambda n, m: (0, 0),
+}
+
+
+@pytest.fixture(scope="module")
+def costs(django_db_setup, django_db_blocker):
+    with django_db_blocker.unblock():
+        return measure_costs(SIZES)
+
+
+def test_costs_grow_as_expected(costs):
+    assert check_cost_growth(costs, SIZES) == []
+
+
+@pytest.mark.parametrize("scenario", EXPECTED_GROWTH)
+def test_costs_match_budget(costs, scenario):
+    assert {
+        size: (counts["queries"], counts["keycloak_requests"])
+        for size, counts in costs[scenario].items()
+    } == {f"{n}x{m}": BUDGETS[scenario](n, m) for n, m in SIZES}
@@ -0,0 +1,150 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import re
+
+import pytest
+from django.contrib.auth.models import Group
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import reverse
+from loguru import logger
+
+from idandsso.diagnostics import (
+    RequestDiagnostics,
+    record_operation,
+    report,
+    request_diagnostics,
+)
+from idandsso.groupindex import (
+    group_names,
+    invalidate_group_index,
+)
+from idandsso.keycloak import (
+    _akeycloak_admin,
+    _keycloak_admin,
+)
+
+
+@pytest.fixture
+def warnings():
+    messages = []
+    handler = logger.add(lambda message: messages.append(str(message)), level="WARNING")
+    yield messages
+    logger.remove(handler)
+
+
+def _diagnostics(queries=0, idp_calls=0) -> RequestDiagnostics:
+    diagnostics = RequestDiagnostics()
+    for _ in range(queries):
+        diagnostics.record_query(0.0004)
+    for _ in range(idp_calls):
+        diagnostics.record_idp_call()
+    return diagnostics
+
+
+def test_server_timing_lists_queries_idp_calls_and_operations():
+    diagnostics = _diagnostics(queries=2, idp_calls=3)
+    diagnostics.record_operation("sync", 0.002)
+    diagnostics.record_operation("login", 0.001)
+    diagnostics.record_operation("login", 0.0015)
+    assert diagnostics.server_timing() == (
+        'idandsso-db;desc="2 queries";dur=0.8, idandsso-idp;desc="3 calls", '
+        'idandsso-login;desc="2x";dur=2.5, idandsso-sync;desc="1x";dur=2.0'
+    )
+
+
+def test_report_appends_to_an_existing_server_timing_header():
+    response = HttpResponse()
+    response["Server-Timing"] = "app;dur=12"
+    report(RequestFactory().get("/"), response, _diagnostics(queries=1))
+    assert response["Server-Timing"].startswith('app;dur=12, idandsso-db;desc="1 queries"')
+
+
+def test_exceeded_budgets_are_warned(settings, warnings):
+    settings.IDANDSSO_DIAGNOSTICS_BUDGETS = {"queries": 1, "idp_calls": 2, "unknown": 0}
+    report(RequestFactory().get("/page/"), HttpResponse(), _diagnostics(queries=2, idp_calls=2))
+    assert len(warnings) == 1
+    assert "exceeded the 'queries' budget of 1 with 2 in GET '/page/'" in warnings[0]
+
+
+def test_operations_are_recorded_within_the_block_only():
+    record_operation("login", 1.0)
+    with request_diagnostics(count_queries=False) as diagnostics:
+        record_operation("login", 0.5)
+    record_operation("login", 1.0)
+    assert diagnostics.operations == {"login": (1, 0.5)}
+
+
+def test_only_queries_of_idandsso_are_counted(db):
+    group = Group.objects.create(name="users")
+    invalidate_group_index()
+    with request_diagnostics() as diagnostics:
+        Group.objects.count()
+        group_names([group.pk])
+    assert diagnostics.queries == 1
+
+
+def test_queries_are_not_counted_without_count_queries(db):
+    invalidate_group_index()
+    with request_diagnostics(count_queries=False) as diagnostics:
+        group_names([0])
+    assert diagnostics.queries == 0
+
+
+def test_keycloak_calls_are_counted(kc):
+    with request_diagnostics(count_queries=False) as diagnostics:
+        _keycloak_admin().users_count()
+    # the token and the count
+    assert diagnostics.idp_calls == kc.count() == 2
+
+
+def test_async_keycloak_calls_are_counted(kc):
+    async def count_users():
+        admin = await _akeycloak_admin()
+        await admin.a_users_count()
+
+    with request_diagnostics(count_queries=False) as diagnostics:
+        asyncio.run(count_users())
+    assert diagnostics.idp_calls == kc.count() == 2
+
+
+def test_middleware_adds_the_server_timing_header(client, settings):
+    settings.IDANDSSO_DIAGNOSTICS = True
+    response = client.get(reverse("idandsso_idp_health"))
+    assert re.fullmatch(
+        r'idandsso-db;desc="\d+ queries";dur=[\d.]+, idandsso-idp;desc="0 calls"',
+        response["Server-Timing"],
+    )
+
+
+def test_middleware_adds_no_header_without_diagnostics(client):
+    assert not client.get(reverse("idandsso_idp_health")).has_header("Server-Timing")
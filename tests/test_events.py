@@ -0,0 +1,126 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import hmac
+import json
+
+import pytest
+from django.urls import reverse
+
+pytestmark = pytest.mark.django_db
+
+SECRET = "webhook-secret"
+
+
+@pytest.fixture
+def post_events(client, settings):
+    """
+    Posts admin events to the keycloak_events webhook, with the given headers.
+    """
+    settings.IDANDSSO_WEBHOOK_SECRET = SECRET
+
+    def post_events(events: [dict], **headers):
+        headers.setdefault("Authorization", f"Bearer {SECRET}")
+        return client.post(
+            reverse("idandsso_keycloak_events"),
+            data=json.dumps(events),
+            content_type="application/json",
+            headers=headers,
+        )
+
+    return post_events
+
+
+def test_webhook_is_disabled_without_secret(client, settings):
+    settings.IDANDSSO_WEBHOOK_SECRET = None
+    response = client.post(
+        reverse("idandsso_keycloak_events"), data="[]", content_type="application/json"
+    )
+    assert response.status_code == 404
+
+
+def test_webhook_rejects_invalid_credentials(kc, groups, make_user, post_events):
+    user = make_user("alice")
+    kc.add_member("kc_users", user.socialaccount_set.get().uid)
+    events = kc.pop_admin_events()
+    assert post_events(events, Authorization="Bearer wrong").status_code == 401
+    assert post_events(events, Authorization="Bearer wröng").status_code == 401
+    assert (
+        post_events(events, Authorization="", **{"X-Keycloak-Signature": "0" * 64}).status_code
+        == 401
+    )
+    assert (
+        post_events(events, Authorization="", **{"X-Keycloak-Signature": "ö" * 64}).status_code
+        == 401
+    )
+    assert not user.groups.exists()
+
+
+def test_webhook_accepts_hmac_signature(kc, groups, make_user, post_events):
+    user = make_user("alice")
+    kc.add_member("kc_users", user.socialaccount_set.get().uid)
+    body = json.dumps(kc.pop_admin_events())
+    signature = hmac.new(SECRET.encode(), body.encode(), hashlib.sha256).hexdigest()
+    response = post_events(
+        json.loads(body), Authorization="", **{"X-Keycloak-Signature": signature}
+    )
+    assert response.status_code == 200
+    assert set(user.groups.values_list("name", flat=True)) == {"users"}
+
+
+def test_webhook_applies_adds_and_removes(kc, groups, make_user, post_events):
+    alice, bob = make_user("alice"), make_user("bob")
+    bob.groups.add(groups["admin"])
+    alice_id, bob_id = (user.socialaccount_set.get().uid for user in [alice, bob])
+    kc.add_member("kc_users", alice_id)
+    kc.add_member("kc_admin", alice_id)
+    kc.remove_member("kc_admin", alice_id)
+    kc.remove_member("kc_admin", bob_id)
+    kc.reset_requests()
+
+    response = post_events(kc.pop_admin_events())
+    assert response.json() == {"received": 4, "duplicates": 0, "applied": 4, "ignored": 0}
+    assert set(alice.groups.values_list("name", flat=True)) == {"users"}
+    assert not bob.groups.exists()
+    assert kc.requests == []
+
+
+def test_webhook_skips_redelivered_events(kc, groups, make_user, post_events):
+    user = make_user("alice")
+    uid = user.socialaccount_set.get().uid
+    kc.add_member("kc_users", uid)
+    events = kc.pop_admin_events()
+    post_events(events)
+    user.groups.clear()
+
+    response = post_events(events + events)
+    assert response.json() == {"received": 2, "duplicates": 2, "applied": 0, "ignored": 0}
+    assert not user.groups.exists()
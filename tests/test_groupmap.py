@@ -0,0 +1,92 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from idandsso.groupmap import (
+    GroupMapping,
+    group_mapping,
+)
+
+MAP = {
+    "ut_users": "users",
+    "ut_project_*": "project_*",
+    "ut_team_*_members": "team",
+    "ut_*_*": "ignored_*",
+}
+
+
+def test_exact_names_map_both_ways():
+    mapping = GroupMapping(MAP, [])
+    assert mapping.django_group_name("ut_users") == "users"
+    assert mapping.keycloak_group_name("users") == "ut_users"
+
+
+def test_patterns_map_both_ways():
+    mapping = GroupMapping(MAP, [])
+    assert mapping.django_group_names(["ut_project_x", "ut_project_y"]) == {
+        "project_x",
+        "project_y",
+    }
+    assert mapping.keycloak_group_names(["project_x"]) == {"ut_project_x"}
+
+
+def test_patterns_with_a_constant_side_map_one_way():
+    mapping = GroupMapping(MAP, [])
+    assert mapping.django_group_name("ut_team_a_members") == "team"
+    assert mapping.keycloak_group_name("team") is None
+
+
+def test_patterns_with_several_stars_are_ignored():
+    mapping = GroupMapping(MAP, [])
+    assert mapping.django_group_name("ut_a_b") is None
+    assert mapping.keycloak_group_name("ignored_a") is None
+
+
+def test_unmapped_names_are_skipped():
+    mapping = GroupMapping(MAP, [])
+    assert mapping.django_group_names(["ut_other", "ut_users"]) == {"users"}
+    assert mapping.keycloak_group_names(["other", "users"]) == {"ut_users"}
+
+
+def test_staff_and_superuser_groups_are_not_mapped():
+    mapping = GroupMapping({**MAP, "ut_staff": "staff"}, ["ut_staff", "ut_superuser"])
+    assert mapping.django_group_names(["ut_staff", "ut_superuser", "ut_users"]) == {"users"}
+
+
+def test_empty_map_keeps_names_at_login_and_syncs_no_group():
+    mapping = GroupMapping({}, ["ut_staff"])
+    assert mapping.django_group_names(["ut_users", "ut_staff"]) == {"ut_users"}
+    assert mapping.keycloak_group_names(["ut_users"]) == set()
+
+
+def test_mapping_is_rebuilt_on_setting_changes(settings):
+    assert group_mapping().django_group_name("kc_users") == "users"
+    settings.IDANDSSO_GROUP_MAP = {"kc_users": "members"}
+    assert group_mapping().django_group_name("kc_users") == "members"
+    assert group_mapping().keycloak_group_name("members") == "kc_users"
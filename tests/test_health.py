@@ -0,0 +1,154 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+import requests
+from django.urls import reverse
+from django.utils import timezone
+
+from idandsso import health
+
+
+@pytest.fixture(autouse=True)
+def reset_status():
+    health._status.update(available=None, latency=None, checked_at=None, error=None)
+    health._probing.clear()
+    yield
+    health._status.update(available=None, latency=None, checked_at=None, error=None)
+
+
+@pytest.fixture
+def idp(monkeypatch):
+    """
+    Records the probes of the IDP, which responds with `idp.status_code`.
+    """
+    idp = SimpleNamespace(status_code=200, probes=[])
+
+    def get(url, timeout):
+        idp.probes.append(url)
+        return SimpleNamespace(status_code=idp.status_code)
+
+    monkeypatch.setattr(health.requests, "get", get)
+    return idp
+
+
+@pytest.fixture
+def scheduled(monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(health, "probe_idp", lambda: scheduled.append("sync"))
+    monkeypatch.setattr(health, "probe_idp_in_background", lambda: scheduled.append("background"))
+    return scheduled
+
+
+@pytest.mark.parametrize(
+    ("mode", "argv", "expected"),
+    [
+        ("off", ["gunicorn"], []),
+        ("lazy", ["gunicorn"], []),
+        ("sync", ["manage.py", "migrate"], ["sync"]),
+        ("background", ["gunicorn"], ["background"]),
+        ("background", ["manage.py", "runserver"], ["background"]),
+        ("background", ["manage.py", "migrate"], []),
+        ("background", ["/usr/bin/django-admin", "check"], []),
+    ],
+)
+def test_probe_on_startup_depends_on_the_mode(
+    settings, monkeypatch, scheduled, mode, argv, expected
+):
+    settings.IDANDSSO_IDP_PROBE = mode
+    monkeypatch.setattr(health.sys, "argv", argv)
+    health.schedule_idp_probe()
+    assert scheduled == expected
+
+
+def test_health_view_probes_lazily_once(client, idp):
+    response = client.get(reverse("idandsso_idp_health"))
+    assert response.status_code == 200
+    assert response.json()["status"] == "ok"
+    assert response.json()["keycloak_circuit"] == "closed"
+    assert response["Cache-Control"].startswith("max-age=0")
+    client.get(reverse("idandsso_idp_health"))
+    assert len(idp.probes) == 1
+
+
+def test_health_view_reports_an_unavailable_idp(client, idp):
+    idp.status_code = 502
+    response = client.get(reverse("idandsso_idp_health"))
+    assert response.status_code == 503
+    assert response.json()["status"] == "unavailable"
+    assert "not reachable" in response.json()["error"]
+
+
+def test_health_view_reports_connection_errors(client, monkeypatch):
+    def get(url, timeout):
+        raise requests.ConnectionError("refused")
+
+    monkeypatch.setattr(health.requests, "get", get)
+    response = client.get(reverse("idandsso_idp_health"))
+    assert response.status_code == 503
+    assert response.json()["error"] == "refused"
+
+
+def test_stale_status_is_refreshed_in_the_background(settings, idp, monkeypatch):
+    settings.IDANDSSO_IDP_PROBE_INTERVAL = 60
+    health.probe_idp()
+    refreshes = []
+    monkeypatch.setattr(health, "probe_idp_in_background", lambda: refreshes.append(True))
+    assert health.idp_status()["available"]
+    assert refreshes == []
+    health._status["checked_at"] = timezone.now() - timedelta(seconds=61)
+    assert health.idp_status()["available"]
+    assert refreshes == [True]
+    assert len(idp.probes) == 1
+
+
+def test_only_one_background_probe_runs_at_a_time(settings, monkeypatch):
+    probes = []
+    release = threading.Event()
+
+    def get(url, timeout):
+        probes.append(url)
+        release.wait(5)
+        return SimpleNamespace(status_code=200)
+
+    monkeypatch.setattr(health.requests, "get", get)
+    health.probe_idp_in_background()
+    health.probe_idp_in_background()
+    release.set()
+    deadline = time.monotonic() + 5
+    while health._probing.is_set() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert probes == [settings.IDANDSSO_PROVIDER_HOST]
+    assert health.idp_status()["available"]
@@ -0,0 +1,105 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+from django.test import override_settings
+from keycloak.exceptions import KeycloakConnectionError
+
+from idandsso.keycloak import (
+    CircuitOpenError,
+    _circuit_breaker,
+    _keycloak_admin,
+    _resilient_call,
+    token_refresh_margin,
+)
+from idandsso.testing import (
+    FakeKeycloak,
+    reset_idandsso_state,
+)
+
+
+@pytest.fixture
+def breaker(settings):
+    settings.IDANDSSO_KEYCLOAK_CIRCUIT_FAILURE_THRESHOLD = 1
+    settings.IDANDSSO_KEYCLOAK_CIRCUIT_RESET_TIMEOUT = 60
+    settings.IDANDSSO_KEYCLOAK_RETRIES = 0
+    _circuit_breaker.reset()
+    yield _circuit_breaker
+    _circuit_breaker.reset()
+
+
+def _fail(error):
+    def call():
+        raise error
+
+    return call
+
+
+def test_breaker_opens_and_closes_after_successful_trial(breaker, settings):
+    with pytest.raises(KeycloakConnectionError):
+        _resilient_call(_fail(KeycloakConnectionError("refused")))
+    assert breaker.state()["state"] == "open"
+    with pytest.raises(CircuitOpenError):
+        _resilient_call(lambda: "not called")
+
+    settings.IDANDSSO_KEYCLOAK_CIRCUIT_RESET_TIMEOUT = 0
+    assert _resilient_call(lambda: "trial") == "trial"
+    assert breaker.state()["state"] == "closed"
+
+
+@pytest.mark.parametrize("error", [ConnectionError("cache unavailable"), KeyboardInterrupt()])
+def test_aborted_trial_reopens_the_breaker(breaker, settings, error):
+    with pytest.raises(KeycloakConnectionError):
+        _resilient_call(_fail(KeycloakConnectionError("refused")))
+    settings.IDANDSSO_KEYCLOAK_CIRCUIT_RESET_TIMEOUT = 0
+    with pytest.raises(type(error)):
+        _resilient_call(_fail(error))
+    assert breaker.state()["state"] == "open"
+    # the next trial is let through instead of failing fast forever
+    assert _resilient_call(lambda: "trial") == "trial"
+    assert breaker.state()["state"] == "closed"
+
+
+@pytest.mark.parametrize(("lifetime", "margin"), [(300, 30), (600, 30), (60, 6), (10, 1), (0, 0)])
+def test_refresh_margin_is_clamped_to_the_token_lifetime(settings, lifetime, margin):
+    settings.IDANDSSO_KEYCLOAK_TOKEN_REFRESH_MARGIN = 30
+    assert token_refresh_margin(lifetime) == margin
+
+
+def test_short_lived_admin_token_is_reused(settings):
+    settings.IDANDSSO_KEYCLOAK_TOKEN_REFRESH_MARGIN = 30
+    with FakeKeycloak(token_lifetime=10) as kc, override_settings(**kc.settings()):
+        reset_idandsso_state()
+        try:
+            for _ in range(3):
+                _keycloak_admin()
+            assert kc.count("POST", "token") == 1
+        finally:
+            reset_idandsso_state()
@@ -0,0 +1,119 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+from allauth.socialaccount.models import SocialAccount
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed
+
+from idandsso.groupindex import group_names
+from idandsso.models import LoginClaimsFingerprint
+from idandsso.signals import _store_fingerprint
+from idandsso.testing import record_costs
+
+pytestmark = pytest.mark.django_db
+
+
+def test_login_with_changed_groups_does_not_call_keycloak(kc, groups, make_user, login):
+    user = make_user("alice")
+    user.groups.add(groups["admin"])
+    kc.reset_requests()
+    with record_costs(kc) as costs:
+        login(user, ["kc_users"])
+    costs.assert_budget(keycloak_requests=0)
+    assert set(user.groups.values_list("name", flat=True)) == {"users"}
+
+
+def test_unchanged_login_is_not_reconciled_again(kc, groups, make_user, login):
+    user = make_user("alice")
+    login(user, ["kc_users"])
+    user.groups.clear()
+    login(user, ["kc_users"])
+    assert not user.groups.exists()
+
+
+def test_incomplete_login_is_reconciled_again(settings, kc, groups, make_user, login):
+    settings.IDANDSSO_GROUP_MAP = {**settings.IDANDSSO_GROUP_MAP, "kc_editors": "editors"}
+    user = make_user("alice")
+    login(user, ["kc_users", "kc_editors"])
+    assert not LoginClaimsFingerprint.objects.exists()
+
+    Group.objects.create(name="editors")
+    login(user, ["kc_users", "kc_editors"])
+    assert set(user.groups.values_list("name", flat=True)) == {"users", "editors"}
+    assert LoginClaimsFingerprint.objects.exists()
+
+
+def test_concurrent_first_logins_store_one_fingerprint(kc, make_user):
+    user = make_user("alice")
+    first, second = SocialAccount.objects.get(user=user), SocialAccount.objects.get(user=user)
+    for social_account in [first, second]:
+        assert getattr(social_account, "idandsso_claims_fingerprint", None) is None
+    _store_fingerprint(first, "first")
+    _store_fingerprint(second, "second")
+    assert LoginClaimsFingerprint.objects.get().digest == "second"
+
+
+def test_login_adds_groups_re_created_elsewhere(kc, groups, make_user, login):
+    user = make_user("alice")
+    group_names(group.pk for group in groups.values())
+    # renamed and re-created in bulk, e.g. by another process, without invalidating the index
+    Group.objects.filter(name="users").update(name="former users")
+    Group.objects.bulk_create([Group(name="users")])
+
+    login(user, ["kc_users"])
+    assert set(user.groups.values_list("name", flat=True)) == {"users"}
+
+
+def test_login_sends_m2m_changed_without_calling_keycloak(
+    kc, groups, make_user, login, monkeypatch
+):
+    user = make_user("alice")
+    user.groups.add(groups["admin"])
+    actions = []
+
+    def receiver(sender, action, pk_set, **kwargs):
+        actions.append((action, pk_set))
+
+    m2m_changed.connect(receiver, sender=get_user_model().groups.through)
+    monkeypatch.setattr("idandsso.signals._get_targets", _fail)
+    kc.reset_requests()
+    try:
+        login(user, ["kc_users"])
+    finally:
+        m2m_changed.disconnect(receiver, sender=get_user_model().groups.through)
+    assert ("post_add", {groups["users"].pk}) in actions
+    assert ("post_remove", {groups["admin"].pk}) in actions
+    assert kc.requests == []
+
+
+def _fail(*args, **kwargs):
+    raise AssertionError("not expected to be called")
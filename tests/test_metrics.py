@@ -0,0 +1,116 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+from django.urls import reverse
+
+from idandsso.metrics import (
+    PrometheusMetrics,
+    metrics,
+    reset_metrics,
+    timed,
+)
+
+
+class SmallBuckets(PrometheusMetrics):
+    buckets = (0.1, 1.0)
+
+
+@pytest.fixture
+def prometheus(settings):
+    settings.IDANDSSO_METRICS_BACKEND = "idandsso.metrics.PrometheusMetrics"
+    reset_metrics()
+    yield metrics()
+    reset_metrics()
+
+
+def test_render_prometheus_text_format():
+    backend = SmallBuckets()
+    backend.observe("sync", "success", 0.05)
+    backend.observe("sync", "success", 0.1)
+    backend.observe("sync", "success", 2.0)
+    backend.observe("login", "error", 0.5)
+    assert backend.render() == (
+        "# HELP idandsso_operations_total Number of operations by outcome.\n"
+        "# TYPE idandsso_operations_total counter\n"
+        'idandsso_operations_total{operation="login",outcome="error"} 1\n'
+        'idandsso_operations_total{operation="sync",outcome="success"} 3\n'
+        "# HELP idandsso_operation_duration_seconds Duration of operations by outcome.\n"
+        "# TYPE idandsso_operation_duration_seconds histogram\n"
+        'idandsso_operation_duration_seconds_bucket{operation="login",outcome="error",le="0.1"} 0\n'
+        'idandsso_operation_duration_seconds_bucket{operation="login",outcome="error",le="1.0"} 1\n'
+        'idandsso_operation_duration_seconds_bucket{operation="login",outcome="error",le="+Inf"} 1\n'
+        'idandsso_operation_duration_seconds_sum{operation="login",outcome="error"} 0.5\n'
+        'idandsso_operation_duration_seconds_count{operation="login",outcome="error"} 1\n'
+        'idandsso_operation_duration_seconds_bucket{operation="sync",outcome="success",le="0.1"} 2\n'
+        'idandsso_operation_duration_seconds_bucket{operation="sync",outcome="success",le="1.0"} 2\n'
+        'idandsso_operation_duration_seconds_bucket{operation="sync",outcome="success",le="+Inf"} 3\n'
+        'idandsso_operation_duration_seconds_sum{operation="sync",outcome="success"} 2.15\n'
+        'idandsso_operation_duration_seconds_count{operation="sync",outcome="success"} 3\n'
+    )
+
+
+def test_render_without_observations():
+    assert PrometheusMetrics().render().splitlines() == [
+        "# HELP idandsso_operations_total Number of operations by outcome.",
+        "# TYPE idandsso_operations_total counter",
+        "# HELP idandsso_operation_duration_seconds Duration of operations by outcome.",
+        "# TYPE idandsso_operation_duration_seconds histogram",
+    ]
+
+
+def test_timed_observes_the_outcome(prometheus):
+    with timed("login"):
+        pass
+    with pytest.raises(ValueError), timed("login"):
+        raise ValueError()
+    with timed("keycloak_group_lookup") as observation:
+        observation.outcome = "cache_hit"
+    rendered = prometheus.render()
+    for labels in [
+        'operation="login",outcome="success"',
+        'operation="login",outcome="error"',
+        'operation="keycloak_group_lookup",outcome="cache_hit"',
+    ]:
+        assert f"idandsso_operations_total{{{labels}}} 1\n" in rendered
+
+
+def test_metrics_view_renders_the_backend(client, prometheus):
+    with timed("logout_token"):
+        pass
+    response = client.get(reverse("idandsso_metrics"))
+    assert response.status_code == 200
+    assert response["Content-Type"] == "text/plain; version=0.0.4; charset=utf-8"
+    assert response.content.decode() == prometheus.render()
+
+
+def test_metrics_view_is_not_found_without_prometheus_backend(client):
+    reset_metrics()
+    assert client.get(reverse("idandsso_metrics")).status_code == 404
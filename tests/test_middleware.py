@@ -0,0 +1,139 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from idandsso.middleware import KeycloakSilentSSOMiddleware
+from idandsso.utils import (
+    SSO_HINT_COOKIE,
+    sso_hint_needs_refresh,
+)
+
+AGE = 1000
+
+
+@pytest.fixture(autouse=True)
+def session_cookie_age(settings):
+    settings.SESSION_COOKIE_AGE = AGE
+    settings.IDANDSSO_SSO_HINT_REFRESH_FRACTION = 0.5
+
+
+class UnexpectedUser:
+    @property
+    def is_authenticated(self):
+        raise AssertionError("the user must not be loaded")
+
+
+def _request(path="/", age=None, user=SimpleNamespace(is_authenticated=True), **headers):
+    request = RequestFactory().get(path, headers={"Accept": "text/html", **headers})
+    if age is not None:
+        request.COOKIES[SSO_HINT_COOKIE] = f"true:{int(time.time()) - age}"
+    request.user = user
+    return request
+
+
+def _refreshes(request, middleware=None) -> bool:
+    middleware = middleware or KeycloakSilentSSOMiddleware(lambda request: HttpResponse())
+    return SSO_HINT_COOKIE in middleware(request).cookies
+
+
+@pytest.mark.parametrize(
+    ("cookie", "needs_refresh"),
+    [
+        (None, True),
+        ("false", True),
+        ("true", True),
+        ("true:invalid", True),
+        (f"true:{int(time.time())}", False),
+        (f"true:{int(time.time()) - 400}", False),
+        (f"true:{int(time.time()) - 600}", True),
+    ],
+)
+def test_sso_hint_needs_refresh_below_the_fraction_of_its_lifetime(cookie, needs_refresh):
+    request = RequestFactory().get("/")
+    if cookie is not None:
+        request.COOKIES[SSO_HINT_COOKIE] = cookie
+    assert sso_hint_needs_refresh(request) == needs_refresh
+
+
+def test_refresh_fraction_is_configurable(settings):
+    settings.IDANDSSO_SSO_HINT_REFRESH_FRACTION = 0.9
+    assert _refreshes(_request(age=400))
+    settings.IDANDSSO_SSO_HINT_REFRESH_FRACTION = 0.1
+    assert not _refreshes(_request(age=800))
+
+
+def test_html_responses_of_authenticated_users_refresh_a_stale_hint():
+    assert _refreshes(_request())
+    assert _refreshes(_request(age=600))
+    assert not _refreshes(_request(age=10))
+
+
+def test_fresh_hint_is_not_refreshed_without_loading_the_user():
+    assert not _refreshes(_request(age=10, user=UnexpectedUser()))
+
+
+@pytest.mark.parametrize("accept", ["application/json", "*/*", ""])
+def test_other_responses_do_not_refresh_the_hint(accept):
+    assert not _refreshes(_request(Accept=accept, user=UnexpectedUser()))
+
+
+def test_anonymous_users_get_no_hint():
+    assert not _refreshes(_request(user=SimpleNamespace(is_authenticated=False)))
+
+
+def test_skip_path_prefixes_short_circuit(settings):
+    settings.IDANDSSO_SSO_SKIP_PATH_PREFIXES = ["/static/", "/media/"]
+    middleware = KeycloakSilentSSOMiddleware(lambda request: HttpResponse())
+    assert not _refreshes(_request("/static/app.css", user=UnexpectedUser()), middleware)
+    assert not _refreshes(_request("/media/a.png", user=UnexpectedUser()), middleware)
+    assert _refreshes(_request("/page/"), middleware)
+
+
+def test_skip_path_prefixes_default_to_static_and_media_url(settings):
+    settings.STATIC_URL = "/static/"
+    settings.MEDIA_URL = "/"
+    del settings.IDANDSSO_SSO_SKIP_PATH_PREFIXES
+    assert KeycloakSilentSSOMiddleware(HttpResponse).skip_path_prefixes == ("/static/",)
+
+
+def test_async_middleware_refreshes_a_stale_hint():
+    async def get_response(request):
+        return HttpResponse()
+
+    middleware = KeycloakSilentSSOMiddleware(get_response)
+    assert SSO_HINT_COOKIE in asyncio.run(middleware(_request(age=600))).cookies
+    assert SSO_HINT_COOKIE not in asyncio.run(middleware(_request(age=10))).cookies
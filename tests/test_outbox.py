@@ -0,0 +1,118 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.db import transaction
+from django.utils import timezone
+
+from idandsso import outbox
+from idandsso.models import KeycloakSyncIntent
+from idandsso.outbox import (
+    enqueue_sync_intents,
+    process_batch,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def outbox_enabled(settings):
+    settings.IDANDSSO_SYNC_OUTBOX = True
+
+
+def test_intents_are_stored_within_the_transaction(kc, groups, make_user):
+    user = make_user("alice")
+    user.groups.add(groups["users"])
+    try:
+        with transaction.atomic():
+            user.groups.add(groups["admin"])
+            raise RuntimeError("rolled back")
+    except RuntimeError:
+        pass
+    assert list(KeycloakSyncIntent.objects.values_list("group_name", "is_add")) == [
+        ("kc_users", True)
+    ]
+    assert process_batch() == (1, 0)
+    assert kc.group_member_ids("kc_users") == {user.socialaccount_set.get().uid}
+    assert not KeycloakSyncIntent.objects.exists()
+
+
+def test_newer_change_replaces_pending_intent(kc, groups, make_user):
+    user = make_user("alice")
+    user.groups.add(groups["users"])
+    user.groups.remove(groups["users"])
+    assert list(KeycloakSyncIntent.objects.values_list("group_name", "is_add")) == [
+        ("kc_users", False)
+    ]
+
+
+def test_claimed_intent_blocks_newer_intents_of_the_pair(kc, groups, make_user):
+    user = make_user("alice")
+    user.groups.add(groups["users"])
+    KeycloakSyncIntent.objects.update(claimed_until=timezone.now() + timedelta(minutes=1))
+    user.groups.remove(groups["users"])
+    user.groups.add(groups["admin"])
+    assert KeycloakSyncIntent.objects.count() == 3
+    # only the intent of the other pair is due
+    assert process_batch() == (1, 0)
+    assert kc.group_member_ids("kc_admin") == {user.socialaccount_set.get().uid}
+
+
+def test_failed_intent_is_superseded_by_newer_intent(kc, groups, make_user):
+    user = make_user("alice")
+    user.groups.add(groups["users"])
+
+    def add_failing_while_removed(*args):
+        # the user is removed from the group while the add is in flight
+        enqueue_sync_intents([user], ["kc_users"], is_add=False)
+        raise ConnectionError("keycloak not available")
+
+    with mock.patch.object(outbox, "add_user_to_keycloak_group", add_failing_while_removed):
+        assert process_batch() == (1, 1)
+    assert list(KeycloakSyncIntent.objects.values_list("is_add", "attempts")) == [(False, 0)]
+    assert process_batch() == (1, 0)
+    assert kc.count("DELETE", "users/{id}/groups/{id}") == 1
+    assert not KeycloakSyncIntent.objects.exists()
+
+
+def test_failed_intent_is_retried_with_backoff(kc, groups, make_user):
+    user = make_user("alice")
+    user.groups.add(groups["users"])
+    with mock.patch.object(
+        outbox, "add_user_to_keycloak_group", side_effect=ConnectionError("unavailable")
+    ):
+        assert process_batch() == (1, 1)
+    intent = KeycloakSyncIntent.objects.get()
+    assert (intent.attempts, intent.claimed_until) == (1, None)
+    assert intent.available_at > timezone.now()
+    assert process_batch() == (0, 0)
@@ -0,0 +1,100 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import uuid
+from datetime import timedelta
+
+import pytest
+from allauth.socialaccount.models import SocialAccount
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.utils import timezone
+
+from idandsso.management.commands import idandsso_reconcile
+from idandsso.models import KeycloakGroupMember
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.mark.parametrize("source", ["keycloak", "django"])
+def test_reconcile_corrects_the_differences(kc, groups, make_user, source):
+    in_both, only_keycloak, only_django = make_user("a"), make_user("b"), make_user("c")
+    for user in [in_both, only_keycloak]:
+        kc.add_member("kc_users", user.socialaccount_set.get().uid)
+    for user in [in_both, only_django]:
+        user.groups.add(groups["users"])
+    kc.add_member("kc_users", kc.add_user("unknown"))
+    # the same keycloak user id of another provider is not matched
+    other = get_user_model().objects.create(username="other")
+    SocialAccount.objects.create(user=other, provider="orcid", uid=kc.add_user("d"))
+    kc.add_member("kc_users", other.socialaccount_set.get().uid)
+
+    stdout = io.StringIO()
+    call_command("idandsso_reconcile", source=source, page_size=2, chunk_size=1, stdout=stdout)
+
+    assert "kc_users -> users: 1 only in keycloak, 1 only in django, 2 unknown" in stdout.getvalue()
+    django_members = set(groups["users"].user_set.values_list("username", flat=True))
+    kc_members = kc.group_member_ids("kc_users")
+    if source == "keycloak":
+        assert django_members == {"a", "b"}
+    else:
+        assert django_members == {"a", "c"}
+        assert only_django.socialaccount_set.get().uid in kc_members
+        assert only_keycloak.socialaccount_set.get().uid not in kc_members
+    assert not KeycloakGroupMember.objects.exists()
+
+
+def test_members_of_killed_runs_are_deleted_after_a_day(kc, groups, make_user):
+    user = make_user("a")
+    killed, running = uuid.uuid4(), uuid.uuid4()
+    KeycloakGroupMember.objects.create(
+        run=killed, uid="x", created_at=timezone.now() - timedelta(days=2)
+    )
+    # a concurrent run, whose members do not count as members of this run
+    KeycloakGroupMember.objects.create(run=running, uid=user.socialaccount_set.get().uid)
+
+    stdout = io.StringIO()
+    call_command("idandsso_reconcile", stdout=stdout)
+
+    assert "kc_users -> users: 0 only in keycloak, 0 only in django, 0 unknown" in stdout.getvalue()
+    assert list(KeycloakGroupMember.objects.values_list("run", flat=True)) == [running]
+
+
+def test_members_are_deleted_when_the_comparison_fails(kc, groups, make_user, monkeypatch):
+    uid = make_user("a").socialaccount_set.get().uid
+
+    def fail_after_first_page(kc_group_name, page_size):
+        yield [uid]
+        raise RuntimeError("keycloak unavailable")
+
+    monkeypatch.setattr(idandsso_reconcile, "iter_keycloak_group_member_ids", fail_after_first_page)
+    call_command("idandsso_reconcile", stdout=io.StringIO())
+    assert not KeycloakGroupMember.objects.exists()
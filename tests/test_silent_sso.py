@@ -0,0 +1,132 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import time
+
+import pytest
+from django.http import HttpResponse
+from django.template import (
+    Context,
+    Template,
+)
+from django.test import RequestFactory
+
+from idandsso.middleware import KeycloakSilentSSOMiddleware
+from idandsso.utils import (
+    SSO_BACKOFF_COOKIE,
+    SSO_HINT_COOKIE,
+    delete_sso_backoff_cookie,
+    is_silent_sso_candidate,
+    set_sso_backoff_cookie,
+)
+
+BROWSER = "Mozilla/5.0 (X11; Linux x86_64) Firefox/140.0"
+
+
+def _request(method="get", path="/", cookies=None, **headers):
+    request = getattr(RequestFactory(), method)(path, headers={"User-Agent": BROWSER, **headers})
+    request.COOKIES.update({SSO_HINT_COOKIE: "true:0", **(cookies or {})})
+    return request
+
+
+def test_browser_navigation_with_hint_is_a_candidate():
+    assert is_silent_sso_candidate(_request(**{"Sec-Fetch-Mode": "navigate"}))
+
+
+@pytest.mark.parametrize(
+    "request_",
+    [
+        lambda: _request(method="post"),
+        lambda: _request(cookies={SSO_HINT_COOKIE: ""}),
+        lambda: _request(cookies={SSO_BACKOFF_COOKIE: f"1:{int(time.time()) + 60}"}),
+        lambda: _request(**{"User-Agent": "Slackbot-LinkExpanding 1.0"}),
+        lambda: _request(**{"User-Agent": ""}),
+        lambda: _request(**{"Sec-Fetch-Mode": "no-cors"}),
+        lambda: _request(**{"Sec-Fetch-Dest": "iframe"}),
+        lambda: _request(**{"Sec-Purpose": "prefetch"}),
+        lambda: _request(**{"Purpose": "prefetch"}),
+        lambda: _request(**{"X-Requested-With": "XMLHttpRequest"}),
+    ],
+)
+def test_other_requests_are_no_candidates(request_):
+    assert not is_silent_sso_candidate(request_())
+
+
+def test_expired_backoff_allows_a_candidate():
+    assert is_silent_sso_candidate(_request(cookies={SSO_BACKOFF_COOKIE: "3:1"}))
+
+
+def test_backoff_doubles_with_each_failure(settings):
+    settings.IDANDSSO_SSO_BACKOFF = 60
+    settings.IDANDSSO_SSO_BACKOFF_MAX = 200
+    delays = []
+    cookies = {}
+    for _ in range(4):
+        response = HttpResponse()
+        set_sso_backoff_cookie(_request(cookies=cookies), response)
+        failures, until = response.cookies[SSO_BACKOFF_COOKIE].value.split(":")
+        delays.append((int(failures), int(until) - int(time.time())))
+        cookies = {SSO_BACKOFF_COOKIE: response.cookies[SSO_BACKOFF_COOKIE].value}
+    # the time may pass a full second while setting the cookie
+    assert [failures for failures, _ in delays] == [1, 2, 3, 4]
+    for (_, delay), expected in zip(delays, [60, 120, 200, 200]):
+        assert expected - 1 <= delay <= expected
+
+
+def test_declined_login_callback_sets_the_backoff(db):
+    request = _request(path="/accounts/oidc/idandsso/login/callback/?error=login_required")
+    response = KeycloakSilentSSOMiddleware(lambda request: HttpResponse())(request)
+    assert response.cookies[SSO_BACKOFF_COOKIE].value.startswith("1:")
+
+
+def test_backoff_is_deleted_after_login():
+    response = HttpResponse()
+    delete_sso_backoff_cookie(_request(cookies={SSO_BACKOFF_COOKIE: "2:1"}), response)
+    assert response.cookies[SSO_BACKOFF_COOKIE]["max-age"] == 0
+
+
+def test_pages_deciding_the_silent_sso_vary_by_its_headers(db):
+    template = Template(
+        "{% load idandsso %}{% idandsso_silent_sso as silent_sso %}{{ silent_sso }}"
+    )
+
+    def view(request):
+        return HttpResponse(template.render(Context({"request": request})))
+
+    response = KeycloakSilentSSOMiddleware(view)(_request(Accept="text/plain"))
+    assert response.content == b"True"
+    assert {"Cookie", "User-Agent", "Sec-Fetch-Dest"} <= {
+        header.strip() for header in response["Vary"].split(",")
+    }
+
+
+def test_other_pages_do_not_vary(db):
+    response = KeycloakSilentSSOMiddleware(lambda request: HttpResponse())(_request())
+    assert not response.has_header("Vary")
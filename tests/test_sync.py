@@ -0,0 +1,204 @@
+#         Copyright (C) 2026 52°North Spatial Information Research GmbH
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     If the program is linked with libraries which are licensed under one
+#     of the following licenses, the combination of the program with the
+#     linked library is not considered a "derivative work" of the program:
+#
+#         - Apache License, version 2.0
+#         - Apache Software License, version 1.0
+#         - GNU Lesser General Public License, version 3
+#         - Mozilla Public License, versions 1.0, 1.1 and 2.0
+#         - Common Development and Distribution License (CDDL), version 1.0
+#
+#     Therefore the distribution of the program linked with libraries licensed
+#     under the aforementioned licenses, is permitted by the copyright holders
+#     if the distribution is compliant with both the GNU General Public License
+#     version 2 and the aforementioned licenses.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import threading
+import time
+
+import pytest
+from allauth.socialaccount.models import SocialAccount
+from asgiref.sync import (
+    async_to_sync,
+    sync_to_async,
+)
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import (
+    request_finished,
+    request_started,
+)
+from django.db import transaction
+
+from idandsso import keycloak
+from idandsso.socialaccounts import (
+    get_social_account,
+    get_social_account_uids,
+    is_social_account,
+    social_account_scope,
+)
+from idandsso.sync import sync_changes
+from idandsso.utils import is_asgi_request
+
+pytestmark = pytest.mark.django_db
+
+
+def test_rolled_back_savepoint_is_not_synced(
+    kc, groups, make_user, django_capture_on_commit_callbacks
+):
+    user = make_user("alice")
+    kc.reset_requests()
+    with django_capture_on_commit_callbacks(execute=True):
+        with transaction.atomic():
+            user.groups.add(groups["users"])
+        try:
+            with transaction.atomic():
+                user.groups.add(groups["admin"])
+                raise RuntimeError("rolled back")
+        except RuntimeError:
+            pass
+    assert kc.group_member_ids("kc_users") == {_uid(user)}
+    assert kc.group_member_ids("kc_admin") == set()
+
+
+def test_opposite_changes_of_a_transaction_cancel(
+    kc, groups, make_user, django_capture_on_commit_callbacks
+):
+    user = make_user("alice")
+    kc.reset_requests()
+    with django_capture_on_commit_callbacks(execute=True):
+        user.groups.add(groups["users"])
+        with transaction.atomic():
+            user.groups.remove(groups["users"])
+    assert kc.count("PUT") == kc.count("DELETE") == 0
+
+
+def test_changes_after_a_rolled_back_savepoint_are_synced(
+    kc, groups, make_user, django_capture_on_commit_callbacks
+):
+    user = make_user("alice")
+    kc.reset_requests()
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        try:
+            with transaction.atomic():
+                user.groups.add(groups["admin"])
+                raise RuntimeError("rolled back")
+        except RuntimeError:
+            pass
+        user.groups.add(groups["users"])
+        user.groups.remove(groups["users"])
+        user.groups.add(groups["users"])
+    assert len(callbacks) == 3
+    assert kc.group_member_ids("kc_users") == {_uid(user)}
+    assert kc.group_member_ids("kc_admin") == set()
+    assert kc.count("PUT") == 1
+
+
+def test_rolled_back_changes_do_not_hold_back_later_syncs(
+    kc, groups, make_user, django_capture_on_commit_callbacks
+):
+    user = make_user("alice")
+    with django_capture_on_commit_callbacks(execute=True):
+        try:
+            with transaction.atomic():
+                user.groups.add(groups["admin"])
+                raise RuntimeError("rolled back")
+        except RuntimeError:
+            pass
+    with django_capture_on_commit_callbacks(execute=True):
+        user.groups.add(groups["users"])
+    assert kc.group_member_ids("kc_admin") == set()
+    assert kc.group_member_ids("kc_users") == {_uid(user)}
+
+
+def test_parallel_sync_waits_until_one_deadline(settings, kc, make_user, monkeypatch):
+    settings.IDANDSSO_SYNC_MAX_WORKERS = 4
+    settings.IDANDSSO_SYNC_CALL_TIMEOUT = 0.2
+    users = [make_user(f"user{i}") for i in range(8)]
+    release = threading.Event()
+
+    def sync_change(change):
+        if change[0] in users[:4]:
+            release.wait(5)
+
+    monkeypatch.setattr("idandsso.sync._sync_change", sync_change)
+    started = time.monotonic()
+    try:
+        result = sync_changes([(user, "kc_users", True) for user in users])
+    finally:
+        release.set()
+    # two rounds of the pool, not 8 timeouts of one call each
+    assert time.monotonic() - started < 1
+    assert [change[0] for change in result.failed] == users
+    assert result.succeeded == []
+
+
+def test_requests_of_asgi_servers_are_detected():
+    request_started.send(sender=None, environ={})
+    assert not is_asgi_request()
+    request_started.send(sender=None, scope={})
+    assert is_asgi_request()
+    request_finished.send(sender=None)
+    assert not is_asgi_request()
+
+
+def test_asgi_request_syncs_on_the_event_loop(kc, groups, make_user, monkeypatch):
+    user = make_user("alice")
+    awaited = []
+    aadd_user_to_keycloak_group = keycloak.aadd_user_to_keycloak_group
+
+    async def aadd(*args, **kwargs):
+        awaited.append(args[1])
+        return await aadd_user_to_keycloak_group(*args, **kwargs)
+
+    monkeypatch.setattr("idandsso.sync.aadd_user_to_keycloak_group", aadd)
+
+    def view():
+        request_started.send(sender=None, scope={})
+        try:
+            return sync_changes([(user, "kc_users", True)])
+        finally:
+            request_finished.send(sender=None)
+
+    async def server():
+        return await sync_to_async(view)()
+
+    result = async_to_sync(server)()
+    assert (len(result.succeeded), awaited) == (1, ["kc_users"])
+    assert kc.group_member_ids("kc_users") == {_uid(user)}
+
+
+def _uid(user) -> str:
+    return user.socialaccount_set.get().uid
+
+
+@pytest.mark.parametrize("memoised", [False, True])
+def test_social_accounts_of_other_providers_are_ignored(kc, make_user, memoised):
+    user = make_user("alice")
+    uid = user.socialaccount_set.get().uid
+    SocialAccount.objects.create(user=user, provider="orcid", uid="0000-0001")
+    other = get_user_model().objects.create(username="bob")
+    SocialAccount.objects.create(user=other, provider="orcid", uid=kc.add_user("bob"))
+    with social_account_scope() if memoised else contextlib.nullcontext():
+        assert get_social_account(user).provider == settings.IDANDSSO_PROVIDER_ID
+        assert not is_social_account(other)
+        assert get_social_account_uids([user, other]) == {user.pk: uid}
+        result = sync_changes([(user, "kc_users", True), (other, "kc_users", True)])
+    assert [change[0] for change in result.skipped] == [other]
+    assert kc.group_member_ids("kc_users") == {uid}